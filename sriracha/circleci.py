@@ -9,14 +9,57 @@
 # prior written permission is obtained from Lecida Inc.
 """CircleCI CLI utilities."""
 
+from functools import lru_cache
 from typing import Any, Dict, Optional
 
 import circleci.api
+import requests
+from circleci.error import BadVerbError
+from requests.auth import HTTPBasicAuth
 
 CIRCLECI_USERNAME = 'lecida'
 CIRCLECI_VCS_TYPE = 'github'
 
 
+class _SessionApi(circleci.api.Api):
+    """CircleCI API client reusing HTTP connections across requests.
+
+    circleci.api.Api sends each request with a new connection, through the
+    module-level requests functions. This client sends them through a single
+    requests.Session instead.
+
+    """
+
+    def __init__(self, token: str) -> None:
+        """Initialize the client.
+
+        Args:
+            token: The CircleCI API token.
+
+        """
+        super().__init__(token=token)
+        self._session = requests.Session()
+        self._session.auth = HTTPBasicAuth(self.token, '')
+        self._session.headers['Accept'] = 'application/json'
+
+    def _request(self, verb: str, endpoint: str,
+                 data: Optional[Dict[str, Any]] = None) -> Any:
+        if verb not in ('GET', 'POST', 'DELETE'):
+            raise BadVerbError(verb)
+
+        resp = self._session.request(method=verb,
+                                     url=f'{self.url}/{endpoint}',
+                                     json=data if verb == 'POST' else None)
+        resp.raise_for_status()
+
+        return resp.json()
+
+
+@lru_cache(maxsize=8)
+def _get_api(api_token: str) -> circleci.api.Api:
+    return _SessionApi(token=api_token)
+
+
 def trigger_job(api_token: str, project: str, branch: str, job: str,
                 revision: Optional[str], tag: Optional[str]) -> Dict[str, Any]:
     """Trigger a CircleCI build.
@@ -33,7 +76,7 @@ def trigger_job(api_token: str, project: str, branch: str, job: str,
     """
     params = {'CIRCLE_JOB': job}
 
-    api = circleci.api.Api(token=api_token)
+    api = _get_api(api_token)
     return api.trigger_build(username=CIRCLECI_USERNAME, project=project,
                              branch=branch, revision=revision, tag=tag,
                              params=params, vcs_type=CIRCLECI_VCS_TYPE)
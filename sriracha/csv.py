@@ -12,10 +12,26 @@ from __future__ import annotations
 
 import csv
 import io
+import itertools
+import operator
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from types import TracebackType
-from typing import (Any, Callable, Dict, Iterable, List, Optional, TextIO,
-                    Type, Union)
+from typing import (Any, BinaryIO, Callable, Dict, Iterable, List, Optional,
+                    Sequence, Type, Union, cast)
+
+# Encoding of the CSV files
+ENCODING = 'utf-8'
+
+# Size of the write buffer used when line buffering is disabled
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# Number of bytes read at once when looking for the header of existing files
+HEADER_READ_SIZE = 64 * 1024
+
+# Number of rows formatted in memory before each write in write_rows
+ROWS_PER_BATCH = 1000
 
 
 class lecida_dialect(csv.unix_dialect):  # noqa: N801
@@ -28,15 +44,57 @@ class lecida_dialect(csv.unix_dialect):  # noqa: N801
 csv.register_dialect('lecida', lecida_dialect)
 
 
+def _read_first_line(fd: int) -> bytes:
+    """Read the first line of a file from its current position.
+
+    Args:
+        fd: The file descriptor.
+
+    Returns:
+        The first line, including its line terminator if any.
+
+    """
+    chunks = []
+    while True:
+        chunk = os.read(fd, HEADER_READ_SIZE)
+        end = chunk.find(b'\n')
+        if end >= 0:
+            chunks.append(chunk[:end + 1])
+            break
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+class _EncodingWriter(object):
+    """Text file-like object writing encoded strings to a binary file."""
+
+    __slots__ = ('_file',)
+
+    def __init__(self, file: BinaryIO) -> None:
+        """Initialize the writer.
+
+        Args:
+            file: The binary file to write to.
+
+        """
+        self._file = file
+
+    def write(self, s: str) -> int:
+        """Encode a string and write it to the binary file."""
+        return self._file.write(s.encode(ENCODING))
+
+
 class CSVWriter(object):
-    """Custom CSV writer, which allows appending to CSV files."""
+    """Custom CSV writer, which allows appending to UTF-8 CSV files."""
 
     def __init__(self, path: Union[str, Path],
                  field_names: Optional[Iterable[str]] = None,
                  field_name_order_fn:
                  Optional[Callable[[Iterable[str]], List[str]]] = None,
-                 use_line_buffering: bool = True) \
-            -> None:
+                 use_line_buffering: bool = False,
+                 background_writes: bool = False) -> None:
         """Initialize the CSV writer.
 
         Args:
@@ -47,7 +105,13 @@ class CSVWriter(object):
             field_name_order_fn: An ordering function for the field names. If
                 None, field_names will be used, or the ordering of the first
                 row if field_names is None as well. Defaults to None.
-            use_line_buffering: whether to use a line-by-line buffering
+            use_line_buffering: Whether to use a line-by-line buffering. If
+                False, rows are written using a WRITE_BUFFER_SIZE block buffer
+                and are only guaranteed to be on disk after the context
+                manager exits. Defaults to False.
+            background_writes: Whether write_rows and write_columns should
+                write each batch of rows from a background thread, while the
+                next batch is being formatted. Defaults to False.
 
         """
         self._path = Path(path)
@@ -62,38 +126,49 @@ class CSVWriter(object):
         else:
             self._field_names = None
 
-        # If the file already exists, get field names from the file
-        if self._path.exists():
-            with self._path.open(newline='') as csv_file:
-                csv_reader = csv.DictReader(f=csv_file, dialect='lecida')
-                try:
-                    next(csv_reader)
-                    if self._field_names is not None:
-                        # Check that the field names match
-                        if list(csv_reader.fieldnames) != self._field_names:
-                            raise ValueError(f'Custom field_names '
-                                             f'{self._field_names} do not '
-                                             f'correspond to the existing '
-                                             f'file\'s field names '
-                                             f'{csv_reader.fieldnames}')
-                    else:
-                        self._field_names = list(csv_reader.fieldnames)
-                    self._file_already_had_header = True
-                except StopIteration:
-                    self._file_already_had_header = False
-        else:
-            self._file_already_had_header = False
-
         if (self._field_names is not None
                 and not all(isinstance(fn, str) for fn in self._field_names)):
             raise TypeError(f'field_names should contain only strings, but '
                             f'got {self._field_names}')
 
+        # If the file already exists, get field names from its first line.
+        # The file is only opened for appending when the first row is written.
+        self._file_already_had_header = False
+        try:
+            fd = os.open(self._path, os.O_RDONLY)
+        except FileNotFoundError:
+            pass
+        else:
+            try:
+                first_line = _read_first_line(fd).decode(ENCODING)
+            finally:
+                os.close(fd)
+            if first_line:
+                header = next(csv.reader([first_line], dialect='lecida'))
+                if self._field_names is not None:
+                    # Check that the field names match
+                    if header != self._field_names:
+                        raise ValueError(f'Custom field_names '
+                                         f'{self._field_names} do not '
+                                         f'correspond to the existing '
+                                         f'file\'s field names {header}')
+                else:
+                    self._field_names = header
+                self._file_already_had_header = True
+
         self._field_name_order_fn = field_name_order_fn
-        self._file: Optional[TextIO] = None
-        self._dict_writer: Optional[csv.DictWriter] = None
+        self._file: Optional[BinaryIO] = None
+        # csv.writer objects have no public type
+        self._csv_writer: Any = None
+        self._row_getter: Callable[[Dict[str, Any]], Sequence[Any]]
+        # In-memory buffer used to format batches of rows, reused across
+        # write_rows calls
+        self._batch_buffer = io.StringIO()
+        self._batch_writer = csv.writer(self._batch_buffer, dialect='lecida')
 
         self._use_line_buffering = use_line_buffering
+        self._background_writes = background_writes
+        self._executor: Optional[ThreadPoolExecutor] = None
 
     def __enter__(self) -> CSVWriter:
         """Enter the context manager, just returning self."""
@@ -103,49 +178,108 @@ class CSVWriter(object):
                  exc_value: Optional[BaseException],
                  traceback: Optional[TracebackType]) -> Optional[bool]:
         """Exit the context manager, closing open file."""
+        if self._executor is not None:
+            self._executor.shutdown()
         if self._file is not None:
             self._file.close()
 
         return None
 
-    def _get_dict_writer(self, row: Dict[str, Any]) -> csv.DictWriter:
+    def _get_csv_writer(self, row: Dict[str, Any]) -> Any:
         if self._field_names is None:
             if self._field_name_order_fn is not None:
                 self._field_names = self._field_name_order_fn(row.keys())
             else:
                 self._field_names = list(row.keys())
 
-        buffering = 1 if self._use_line_buffering else io.DEFAULT_BUFFER_SIZE
-        self._file = self._path.open('a', newline='', buffering=buffering)
+        if len(self._field_names) == 1:
+            field_name, = self._field_names
+            self._row_getter = lambda row: (row[field_name],)
+        else:
+            self._row_getter = operator.itemgetter(*self._field_names)
+
+        # The file is opened in binary mode, and rows are encoded without
+        # going through a TextIOWrapper. Line buffering is obtained by writing
+        # rows without any buffer: csv writes each row in a single call.
+        buffering = 0 if self._use_line_buffering else WRITE_BUFFER_SIZE
+        self._file = self._path.open('ab', buffering=buffering)
 
-        dict_writer = csv.DictWriter(f=self._file, dialect='lecida',
-                                     fieldnames=self._field_names)
+        csv_writer = csv.writer(_EncodingWriter(self._file), dialect='lecida')
         if not self._file_already_had_header:
-            dict_writer.writeheader()
+            csv_writer.writerow(self._field_names)
+
+        return csv_writer
+
+    def _get_row_values(self, row: Dict[str, Any]) -> Sequence[Any]:
+        """Return the values of a row, ordered by field names.
 
-        return dict_writer
+        Behaves like csv.DictWriter: missing fields are written as empty
+        strings, and extra fields raise a ValueError.
+        """
+        field_names = cast(List[str], self._field_names)
+        if len(row) == len(field_names):
+            try:
+                return self._row_getter(row)
+            except KeyError:
+                pass
+
+        wrong_fields = row.keys() - set(field_names)
+        if wrong_fields:
+            raise ValueError(f'dict contains fields not in fieldnames: '
+                             f'{", ".join(map(repr, wrong_fields))}')
+        return [row.get(field_name, '') for field_name in field_names]
 
     def write_row(self, **row: Any) -> None:
         """Write a row to the csv file."""
-        if self._dict_writer is None:
-            self._dict_writer = self._get_dict_writer(row=row)
+        if self._csv_writer is None:
+            self._csv_writer = self._get_csv_writer(row=row)
 
-        self._dict_writer.writerow(rowdict=row)
+        self._csv_writer.writerow(self._get_row_values(row))
 
     def write_rows(self, rows: Iterable[Any]) -> None:
-        """Write multiple rows to the csv file."""
-        if self._dict_writer is None:
-            rows_it = iter(rows)
+        """Write multiple rows to the csv file.
+
+        Rows are formatted in memory and written ROWS_PER_BATCH at a time.
+        """
+        rows_it = iter(rows)
+        if self._csv_writer is None:
             try:
                 first_row = next(rows_it)
             except StopIteration:
                 # Nothing to do
                 return
-            self._dict_writer = self._get_dict_writer(row=first_row)
-            self._dict_writer.writerow(rowdict=first_row)
-            self._dict_writer.writerows(rows_it)
-        else:
-            self._dict_writer.writerows(rowdicts=rows)
+            self._csv_writer = self._get_csv_writer(row=first_row)
+            rows_it = itertools.chain((first_row,), rows_it)
+
+        if self._background_writes and self._executor is None:
+            # A single thread keeps the writes ordered
+            self._executor = ThreadPoolExecutor(max_workers=1)
+
+        file = cast(BinaryIO, self._file)
+        buffer = self._batch_buffer
+        pending_write: Optional[Future] = None
+        try:
+            while True:
+                batch = list(itertools.islice(rows_it, ROWS_PER_BATCH))
+                if not batch:
+                    break
+                # Reset first, in case a previous batch failed midway
+                buffer.seek(0)
+                buffer.truncate()
+                self._batch_writer.writerows(map(self._get_row_values,
+                                                 batch))
+                data = buffer.getvalue().encode(ENCODING)
+
+                if self._executor is None:
+                    file.write(data)
+                else:
+                    if pending_write is not None:
+                        pending_write.result()
+                    pending_write = self._executor.submit(file.write, data)
+        finally:
+            # Rows are always written when this method returns
+            if pending_write is not None:
+                pending_write.result()
 
     def write_columns(self, **columns: Iterable[Any]) -> None:
         """Write multiple columnss to the csv file."""
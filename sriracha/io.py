@@ -9,28 +9,50 @@
 # prior written permission is obtained from Lecida Inc.
 """IO utility functions."""
 
-import filecmp
+import csv
 import gzip
 import logging
 import os
 import shutil
 import subprocess
 import tarfile
+from concurrent.futures import (FIRST_COMPLETED, Future, ThreadPoolExecutor,
+                                wait)
+from functools import partial
 from pathlib import Path
-from typing import Sequence, Union, overload
+from typing import (List, Optional, Sequence, Set, Tuple, Union,
+                    overload)
 
+import numpy as np
 import pandas as pd
+from typing_extensions import Literal
 
 from sriracha.time import get_timerange_indices
 
 logger = logging.getLogger(__name__)
 
+# Chunk size used when copying file contents
+COPY_BUFFER_SIZE = 1024 * 1024
 
-def gzip_file(filepath: Union[str, Path]) -> None:
+# Maximum number of bytes copied by each os.copy_file_range call
+COPY_FILE_RANGE_SIZE = 1024 * 1024 * 1024
+
+# Chunk size used when counting lines
+LINECOUNT_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Size of the blocks parsed in parallel when reading CSVs with pyarrow
+PYARROW_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def gzip_file(filepath: Union[str, Path], compresslevel: int = 1) -> None:
     """Compress a file.
 
+    Uses pigz if it is available, and Python's gzip module otherwise.
+
     Args:
         filepath: The path to the file.
+        compresslevel: The gzip compression level, from 1 (fastest) to 9
+            (best compression). Defaults to 1.
 
     """
     src_path = Path(filepath)
@@ -41,16 +63,30 @@ def gzip_file(filepath: Union[str, Path]) -> None:
     if dst_path.exists():
         raise FileExistsError(f'{dst_path} already exists.')
 
+    pigz = shutil.which('pigz')
+    if pigz is not None:
+        subprocess.run(  # noqa: S603
+            [pigz, '-k', f'-{compresslevel}', str(src_path)], check=True
+        )
+        return
+
     with src_path.open(mode='rb') as f_in:
-        with gzip.open(filename=dst_path, mode='wb') as f_out:
-            shutil.copyfileobj(fsrc=f_in, fdst=f_out)
+        with gzip.open(filename=dst_path, mode='wb',
+                       compresslevel=compresslevel) as f_out:
+            shutil.copyfileobj(fsrc=f_in, fdst=f_out, length=COPY_BUFFER_SIZE)
 
 
-def gzip_directory(dirpath: Union[str, Path]) -> None:
+def gzip_directory(dirpath: Union[str, Path], compresslevel: int = 1) -> None:
     """Compress a directory.
 
+    Pipes tar into pigz if both are available, and uses Python's tarfile
+    module otherwise.
+
     Args:
         dirpath: The path to the directory.
+        compresslevel: The gzip compression level, from 1 (fastest) to 9
+            (best compression). Defaults to 1, which favors speed, whereas
+            tarfile defaults to 9.
 
     """
     src_path = Path(dirpath)
@@ -58,12 +94,44 @@ def gzip_directory(dirpath: Union[str, Path]) -> None:
         raise ValueError(f'Called gzip_directory, but {src_path} is not a '
                          'directory')
 
-    dst_path = src_path.with_suffix(suffix=f'.tar.gz')
+    dst_path = src_path.with_suffix(suffix='.tar.gz')
     if dst_path.exists():
         raise FileExistsError(f'{dst_path} already exists.')
 
-    with tarfile.open(name=dst_path, mode='w:gz') as tar:
-        tar.add(str(src_path), arcname=src_path.name)
+    pigz = shutil.which('pigz')
+    if pigz is None or shutil.which('tar') is None:
+        with tarfile.open(name=dst_path, mode='w:gz',
+                          compresslevel=compresslevel) as tar:
+            tar.add(str(src_path), arcname=src_path.name)
+        return
+
+    tar_args = ['tar', '-cf', '-', '-C', str(src_path.parent), src_path.name]
+    pigz_args = [pigz, '-c', f'-{compresslevel}']
+    try:
+        with dst_path.open(mode='wb') as f_out:
+            tar_process = subprocess.Popen(tar_args,  # noqa: S603,S607
+                                           stdout=subprocess.PIPE)
+            pigz_process = subprocess.Popen(pigz_args,  # noqa: S603
+                                            stdin=tar_process.stdout,
+                                            stdout=f_out)
+            # Only pigz should hold the pipe, so that tar gets SIGPIPE if
+            # pigz exits early
+            assert tar_process.stdout is not None  # noqa: S101
+            tar_process.stdout.close()
+            pigz_return_code = pigz_process.wait()
+            tar_return_code = tar_process.wait()
+    except BaseException:
+        # Don't leave a partial archive, which later calls would refuse to
+        # overwrite
+        dst_path.unlink()
+        raise
+
+    for args, return_code in ((tar_args, tar_return_code),
+                              (pigz_args, pigz_return_code)):
+        if return_code:
+            dst_path.unlink()
+            raise subprocess.CalledProcessError(returncode=return_code,
+                                                cmd=args)
 
 
 def linecount(filename: str) -> int:
@@ -73,49 +141,89 @@ def linecount(filename: str) -> int:
         filename: The path to the file.
 
     Returns:
-        The result of wc -l, i.e. the count of line.
+        The number of newline characters in the file, like wc -l.
 
     """
-    p = subprocess.run(['wc', '-l', filename], check=True,  # noqa: S603,S607
-                       stdout=subprocess.PIPE)
-    return int(p.stdout.strip().partition(b' ')[0])
+    with open(filename, 'rb') as f:
+        return sum(chunk.count(b'\n')
+                   for chunk in iter(partial(f.read, LINECOUNT_CHUNK_SIZE),
+                                     b''))
 
 
 @overload
 def read_csv_part(csv_path: str, start_index: int, end_index: int,  # noqa: # D103
-                  timestamps: None) -> pd.DataFrame:
+                  timestamps: None = None,
+                  engine: Literal['c', 'pyarrow'] = 'c') -> pd.DataFrame:
     ...
 
 
 @overload
 def read_csv_part(csv_path: str, start_index: pd.Timestamp,  # noqa: # D103
                   end_index: pd.Timestamp,
-                  timestamps: Sequence[pd.Timestamp]) -> pd.DataFrame:
+                  timestamps: Sequence[pd.Timestamp],
+                  engine: Literal['c', 'pyarrow'] = 'c') -> pd.DataFrame:
     ...
 
 
-def read_csv_part(csv_path, start_index, end_index, timestamps=None):
+def read_csv_part(csv_path, start_index, end_index, timestamps=None,
+                  engine='c'):
     """Read part of a csv.
 
     Assumes header is 1 line long. Supports integer and timestamp indices.
 
+    The "c" engine uses pandas' C parser. The "pyarrow" engine requires the
+    optional pyarrow dependency, and parses the CSV with Arrow's multithreaded
+    reader. Column types are then inferred by Arrow instead of pandas, over
+    all the rows after start_index.
+
     """
-    if ((type(start_index) is pd.Timestamp)
-            and (type(end_index) is pd.Timestamp)
+    if (isinstance(start_index, pd.Timestamp)
+            and isinstance(end_index, pd.Timestamp)
             and (timestamps is not None)):
-        # read the index only first
-        start_index, end_index = get_timerange_indices(timestamps,
-                                                       start_index,
-                                                       end_index)
+        # Convert the timestamps once, so that both bounds are binary searched
+        # in the same array, whatever sequence type was given
+        timestamps = np.asarray(timestamps, dtype='datetime64[ns]')
+        start_index, end_index = map(int, get_timerange_indices(timestamps,
+                                                                start_index,
+                                                                end_index))
     elif not (isinstance(start_index, int) and isinstance(end_index, int)):
         raise ValueError(
             "Only supports both integer or both datetime indices,"
             "and timestamps must not be None is datetimes provided")
     logger.info(f"Reading {end_index - start_index} rows")
-    return pd.read_csv(
-        csv_path,
-        skiprows=list(range(1, start_index + 1)),
-        nrows=end_index - start_index, memory_map=True), start_index, end_index
+
+    # Read the header separately, so that the rows before start_index can be
+    # skipped with an integer skiprows, which the C parser handles natively.
+    # pandas parses it, so that the column names are the same as with
+    # header=0, e.g. "Unnamed: 0" for an unnamed index column, or "a.1" for a
+    # duplicate "a" column.
+    header = list(pd.read_csv(csv_path, nrows=0).columns)
+
+    if engine == 'pyarrow':
+        df = _read_csv_rows_pyarrow(csv_path, header=header,
+                                    skip_rows=start_index + 1,
+                                    nrows=end_index - start_index)
+    elif engine == 'c':
+        df = pd.read_csv(csv_path, header=None, names=header,
+                         skiprows=start_index + 1,
+                         nrows=end_index - start_index, memory_map=True)
+    else:
+        raise ValueError(f'Unknown engine: {engine}')
+
+    return df, start_index, end_index
+
+
+def _read_csv_rows_pyarrow(csv_path: str, header: Sequence[str],
+                           skip_rows: int, nrows: int) -> pd.DataFrame:
+    import pyarrow.csv as pacsv
+
+    # The streaming reader (open_csv) would fix the column types from the
+    # first block, and fail on later rows of a wider type
+    read_options = pacsv.ReadOptions(skip_rows=skip_rows,
+                                     column_names=header,
+                                     block_size=PYARROW_BLOCK_SIZE)
+    table = pacsv.read_csv(csv_path, read_options=read_options)
+    return table.slice(0, nrows).to_pandas()
 
 
 def append_to_csv_file(filepath: str, df: pd.DataFrame) -> None:
@@ -129,16 +237,17 @@ def append_to_csv_file(filepath: str, df: pd.DataFrame) -> None:
 
     """
     if os.path.exists(filepath):
-        df_onfile = pd.read_csv(filepath, chunksize=1)
-        chunk_onfile = next(df_onfile)
+        # Only the header is needed to check the columns
+        with open(filepath, newline='') as f:
+            header = next(csv.reader(f))
         # check columns match
-        if set(chunk_onfile.columns) != set(df.columns):
+        if set(header) != set(df.columns):
             raise ValueError("Columns of saved CSV and "
                              "supplied dataframe do not match")
         # enforce same column ordering
-        df = df.loc[:, chunk_onfile.columns]
-        with open(filepath, 'a') as f:
-            df.to_csv(f, index=None, header=None)
+        df = df.loc[:, header]
+        with open(filepath, 'a', buffering=COPY_BUFFER_SIZE) as f:
+            df.to_csv(f, index=None, header=None, chunksize=10000)
     else:
         df.to_csv(filepath, index=None)
 
@@ -158,29 +267,140 @@ def parse_tid_from_key(example_name: str) -> str:
     return example_name.split('_')[0]
 
 
+def _same_file_contents(path_1: str, path_2: str) -> bool:
+    """Return whether two files have the same content.
+
+    Files with different sizes are considered different without being read.
+    Otherwise, their contents are compared COPY_BUFFER_SIZE bytes at a time.
+
+    """
+    if os.stat(path_1).st_size != os.stat(path_2).st_size:
+        return False
+
+    with open(path_1, 'rb') as f_1, open(path_2, 'rb') as f_2:
+        while True:
+            chunk_1 = f_1.read(COPY_BUFFER_SIZE)
+            if chunk_1 != f_2.read(COPY_BUFFER_SIZE):
+                return False
+            if not chunk_1:
+                return True
+
+
+def _copy_file(src: str, dst: str) -> None:
+    """Copy the content of a file, letting the kernel copy it if possible.
+
+    os.copy_file_range avoids copying the data through user space, and
+    allows copy-on-write filesystems to share the underlying blocks. Falls
+    back to shutil.copyfile if it is not available (Python < 3.8, non-Linux
+    platforms) or not supported by the filesystems. Some filesystems return 0
+    without copying anything, so shutil.copyfile also copies the file again
+    if fewer bytes than its size, or none, were copied.
+
+    """
+    try:
+        with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
+            size = os.fstat(f_src.fileno()).st_size
+            copied = 0
+            while True:
+                n_bytes = os.copy_file_range(f_src.fileno(), f_dst.fileno(),
+                                             COPY_FILE_RANGE_SIZE)
+                if not n_bytes:
+                    break
+                copied += n_bytes
+        if copied and copied >= size:
+            return
+    except (AttributeError, OSError):
+        pass
+    shutil.copyfile(src, dst)
+
+
+def _list_files_and_dirs(dir_path: str) -> Tuple[Set[str], Set[str]]:
+    """Return the names of the files and of the subdirectories of a directory.
+
+    Uses a single os.scandir pass, whose entries usually don't need an
+    additional stat call to know their type.
+
+    """
+    file_names = set()
+    dir_names = set()
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            if entry.is_file():
+                file_names.add(entry.name)
+            elif entry.is_dir():
+                dir_names.add(entry.name)
+    return file_names, dir_names
+
+
 def merge_datasets_helper(in_dir_1: str, in_dir_2: str, out_dir: str,
-                          symlink: bool) -> None:
+                          symlink: bool, max_workers: Optional[int] = None) \
+        -> None:
     """Merge 2 datasets by symlinks and appending their summary files.
 
+    Directories shared by both datasets are merged in parallel threads, and
+    files are symlinked or copied from the same threads.
+
     Args:
         in_dir_1: The path to the first dataset.
         in_dir_2: The path to the second dataset.
         out_dir: The path to the output dataset.
         symlink: Whether to create symlinks. Otherwise, copy files.
+        max_workers: The maximum number of threads. If None, uses the default
+            of concurrent.futures.ThreadPoolExecutor.
+
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(_merge_dataset_directory, in_dir_1,
+                                   in_dir_2, out_dir, symlink)}
+        # Only directory merges are waited on in the loop below, file
+        # operations are checked for errors once everything is submitted
+        file_futures: List[Future] = []
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                links, copies, shared_dirs = future.result()
+                file_futures.extend(executor.submit(os.symlink, src, dst)
+                                    for src, dst in links)
+                file_futures.extend(executor.submit(_copy_file, src, dst)
+                                    for src, dst in copies)
+                # recurse into directories, but with symlink on
+                for dir_1, dir_2, dir_out in shared_dirs:
+                    pending.add(executor.submit(_merge_dataset_directory,
+                                                dir_1, dir_2, dir_out, True))
+
+        for future in file_futures:
+            future.result()
+
+
+def _merge_dataset_directory(in_dir_1: str, in_dir_2: str, out_dir: str,
+                             symlink: bool) \
+        -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]],
+                 List[Tuple[str, str, str]]]:
+    """Merge the top level of 2 dataset directories.
+
+    Summary CSV files are merged right away, while symlinks and copies are
+    left to the caller.
+
+    Returns:
+        The (src, dst) paths of the symlinks to create, the (src, dst) paths
+        of the files to copy, and the (in_dir_1, in_dir_2, out_dir) paths of
+        the subdirectories that are in both datasets, and still need to be
+        merged.
 
     """
+    links: List[Tuple[str, str]] = []
+    copies: List[Tuple[str, str]] = []
+    file_operations = links if symlink else copies
+
     def disambiguate_and_copy(fn, dir_1, dir_2, dir_out):
         full_f_path_1 = os.path.join(dir_1, fn)
         full_f_path_2 = os.path.join(dir_2, fn)
 
         # check if the files are the same. if so, don't need to
         # disambiguate
-        if filecmp.cmp(full_f_path_1, full_f_path_2, shallow=False):
+        if _same_file_contents(full_f_path_1, full_f_path_2):
             new_fn_full_path = os.path.join(out_dir, fn)
-            if symlink:
-                os.symlink(full_f_path_1, new_fn_full_path)
-            else:
-                shutil.copyfile(full_f_path_1, new_fn_full_path)
+            file_operations.append((full_f_path_1, new_fn_full_path))
         else:
             basename, ext = os.path.splitext(fn)
             new_fn_1 = f"{basename}_1{ext}"
@@ -188,44 +408,36 @@ def merge_datasets_helper(in_dir_1: str, in_dir_2: str, out_dir: str,
             new_fn_1_abspath = os.path.join(dir_out, new_fn_1)
             new_fn_2_abspath = os.path.join(dir_out, new_fn_2)
 
-            if symlink:
-                os.symlink(full_f_path_1, new_fn_1_abspath)
-                os.symlink(full_f_path_2, new_fn_2_abspath)
-            else:
-                shutil.copyfile(full_f_path_1, new_fn_1_abspath)
-                shutil.copyfile(full_f_path_2, new_fn_2_abspath)
+            file_operations.append((full_f_path_1, new_fn_1_abspath))
+            file_operations.append((full_f_path_2, new_fn_2_abspath))
 
     def merge_csv_files(csv_file_list, out):
         header_saved = False
-        with open(out, 'w') as fout:
+        with open(out, 'wb', buffering=COPY_BUFFER_SIZE) as fout:
             for filename in csv_file_list:
-                with open(filename) as fin:
-                    header = next(fin)
+                with open(filename, 'rb') as fin:
+                    header = fin.readline()
                     if not header_saved:
                         fout.write(header)
                         header_saved = True
-                    for line in fin:
-                        fout.write(line)
+                    # Copy the rest of the file by blocks
+                    shutil.copyfileobj(fin, fout, length=COPY_BUFFER_SIZE)
 
     in_dir_1 = os.path.abspath(in_dir_1)
     in_dir_2 = os.path.abspath(in_dir_2)
     os.makedirs(out_dir, exist_ok=False)
 
+    in_dir_1_files, in_dir_1_dirs = _list_files_and_dirs(in_dir_1)
+    in_dir_2_files, in_dir_2_dirs = _list_files_and_dirs(in_dir_2)
+
     # copy the exclusive files in top level
-    in_dir_1_files = {f for f in os.listdir(in_dir_1)
-                      if os.path.isfile(os.path.join(in_dir_1, f))}
-    in_dir_2_files = {f for f in os.listdir(in_dir_2)
-                      if os.path.isfile(os.path.join(in_dir_2, f))}
     for fname in in_dir_1_files.symmetric_difference(in_dir_2_files):
         new_full_f_path = os.path.join(out_dir, fname)
         if fname in in_dir_1_files:
             full_f_path = os.path.join(in_dir_1, fname)
         else:
             full_f_path = os.path.join(in_dir_2, fname)
-        if symlink:
-            os.symlink(full_f_path, new_full_f_path)
-        else:
-            shutil.copyfile(full_f_path, new_full_f_path)
+        file_operations.append((full_f_path, new_full_f_path))
 
     # deal with same-name files in top level
     for fname in in_dir_1_files.intersection(in_dir_2_files):
@@ -242,34 +454,32 @@ def merge_datasets_helper(in_dir_1: str, in_dir_2: str, out_dir: str,
             disambiguate_and_copy(fname, in_dir_1, in_dir_2, out_dir)
 
     # symlink the exclusive directories
-    in_dir_1_dirs = {f for f in os.listdir(in_dir_1)
-                     if os.path.isdir(os.path.join(in_dir_1, f))}
-    in_dir_2_dirs = {f for f in os.listdir(in_dir_2)
-                     if os.path.isdir(os.path.join(in_dir_2, f))}
     for dname in in_dir_1_dirs.symmetric_difference(in_dir_2_dirs):
         new_full_dname_path = os.path.join(out_dir, dname)
         if dname in in_dir_1_dirs:
             full_f_path = os.path.join(in_dir_1, dname)
         else:
             full_f_path = os.path.join(in_dir_2, dname)
-        os.symlink(full_f_path, new_full_dname_path)
+        links.append((full_f_path, new_full_dname_path))
 
-    # recurse into directories, but with symlink on
-    for dname in in_dir_1_dirs.intersection(in_dir_2_dirs):
-        merge_datasets_helper(
-            os.path.join(in_dir_1, dname),
-            os.path.join(in_dir_2, dname),
-            os.path.join(out_dir, dname),
-            symlink=True)
+    shared_dirs = [(os.path.join(in_dir_1, dname),
+                    os.path.join(in_dir_2, dname),
+                    os.path.join(out_dir, dname))
+                   for dname in in_dir_1_dirs.intersection(in_dir_2_dirs)]
+    return links, copies, shared_dirs
 
 
-def merge_datasets(in_dir_1: str, in_dir_2: str, out_dir: str) -> None:
+def merge_datasets(in_dir_1: str, in_dir_2: str, out_dir: str,
+                   max_workers: Optional[int] = None) -> None:
     """Merge 2 datasets by symlinks and appending their summary files.
 
     Args:
         in_dir_1: The path to the first dataset.
         in_dir_2: The path to the second dataset.
         out_dir: The path to the output dataset.
+        max_workers: The maximum number of threads. If None, uses the default
+            of concurrent.futures.ThreadPoolExecutor.
 
     """
-    merge_datasets_helper(in_dir_1, in_dir_2, out_dir, symlink=False)
+    merge_datasets_helper(in_dir_1, in_dir_2, out_dir, symlink=False,
+                          max_workers=max_workers)
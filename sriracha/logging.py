@@ -18,6 +18,9 @@ import click
 
 import sriracha.main
 
+# Whether setup_logging has already been called
+_logging_configured = False
+
 
 def get_log_file_handler(project: str, log_file_prefix: str = 'log',
                          timespec: str = 'seconds', verbose: bool = True)\
@@ -62,6 +65,10 @@ def setup_logging(project: str, level: int = logging.INFO,
                   datefmt: str = '%Y-%m-%dT%H:%M:%S%z') -> None:
     """Set up logging with a stderr stream + a file stream.
 
+    Only the first call has an effect, subsequent calls are ignored. Like
+    logging.basicConfig, nothing is done either if the root logger already
+    has handlers, e.g. if the application configured logging itself.
+
     Args:
         project: The arbitrary project name, e.g. 'learn/opm',
             'evonik/parser'. If possible, it should start with
@@ -78,11 +85,10 @@ def setup_logging(project: str, level: int = logging.INFO,
         datefmt: The datetime format.
 
     """
-    stream_handler = logging.StreamHandler(stream=sys.stderr)
-    file_handler = get_log_file_handler(project=project,
-                                        log_file_prefix=log_file_prefix,
-                                        timespec=timespec, verbose=verbose)
-    handlers = (stream_handler, file_handler)
+    global _logging_configured
+    root_logger = logging.getLogger()
+    if _logging_configured or root_logger.handlers:
+        return
 
     if format_ is None:
         if style is not None:
@@ -92,5 +98,15 @@ def setup_logging(project: str, level: int = logging.INFO,
     elif style is None:
         raise ValueError('`style` is specified, but not `format_`.')
 
-    logging.basicConfig(handlers=handlers, level=level, format=format_,
-                        style=style, datefmt=datefmt)
+    stream_handler = logging.StreamHandler(stream=sys.stderr)
+    file_handler = get_log_file_handler(project=project,
+                                        log_file_prefix=log_file_prefix,
+                                        timespec=timespec, verbose=verbose)
+
+    formatter = logging.Formatter(fmt=format_, datefmt=datefmt, style=style)
+    for handler in (stream_handler, file_handler):
+        handler.setFormatter(formatter)
+        root_logger.addHandler(handler)
+    root_logger.setLevel(level)
+
+    _logging_configured = True
@@ -11,16 +11,17 @@
 
 import json
 import logging
+import os
 import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
 from configparser import ConfigParser
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import (Callable, Dict, NamedTuple, Optional, TypeVar, Union,
-                    get_type_hints)
+from typing import Any, Callable, Dict, NamedTuple, Optional, TypeVar, Union
 from urllib.parse import ParseResult, urlparse
 
-import boto3
 import click
-from botocore.exceptions import ClientError
 from typing_extensions import Literal
 
 import sriracha.circleci as scci
@@ -33,6 +34,9 @@ LECIDA_CONFIG_PATH = LECIDA_HOME / 'config.ini'
 # Only read write permissions for the current user
 CONFIG_FILE_PERMISSIONS = stat.S_IRUSR | stat.S_IWUSR
 
+# Size of the buffer used to print manifest files
+MANIFEST_BUFFER_SIZE = 64 * 1024
+
 T = TypeVar('T')
 TOrEmptyString = Union[Literal[''], T]
 
@@ -41,22 +45,68 @@ logger = logging.getLogger(__name__)
 
 
 class _ClickContext(NamedTuple):
-    lecida_config: ConfigParser
+    sriracha_config: Dict[str, str]
 
 
 @click.group()
 @click.pass_context
 def cli(ctx) -> None:
     """Group for click."""
-    lecida_config = ConfigParser()
+    try:
+        sriracha_config = _read_sriracha_section(LECIDA_CONFIG_PATH)
+    except FileNotFoundError:
+        sriracha_config = None
 
-    if LECIDA_CONFIG_PATH.exists():
-        lecida_config.read(LECIDA_CONFIG_PATH)
+    ctx.obj = _ClickContext(sriracha_config=sriracha_config or {})
 
-    if 'sriracha' not in lecida_config:
-        lecida_config['sriracha'] = {}
 
-    ctx.obj = _ClickContext(lecida_config=lecida_config)
+def _read_sriracha_section(path: Path) -> Optional[Dict[str, str]]:
+    """Read the sriracha section of a config file.
+
+    Much faster than ConfigParser, but only supports the subset of the INI
+    syntax written by ConfigParser.write, without interpolation: sections,
+    "key = value" or "key: value" options, comments and indented
+    continuation lines.
+
+    Args:
+        path: The path to the config file.
+
+    Returns:
+        The options of the sriracha section, or None if there is no such
+        section.
+
+    """
+    section: Dict[str, str] = {}
+    section_found = False
+    in_section = False
+    option: Optional[str] = None
+    with open(path) as f:
+        for line in f:
+            stripped = line.strip()
+            if not stripped or stripped[0] in '#;':
+                continue
+
+            if line[0].isspace() and option is not None:
+                # Continuation of a multi-line value
+                if in_section:
+                    section[option] += f'\n{stripped}'
+                continue
+
+            if stripped[0] == '[' and stripped[-1] == ']':
+                in_section = stripped[1:-1] == 'sriracha'
+                section_found = section_found or in_section
+                option = None
+                continue
+
+            delimiter_indices = [i for i in map(stripped.find, '=:') if i > 0]
+            if not delimiter_indices:
+                raise ValueError(f'Could not parse line of {path}: {line!r}')
+            delimiter_index = min(delimiter_indices)
+            option = stripped[:delimiter_index].rstrip().lower()
+            if in_section:
+                section[option] = stripped[delimiter_index + 1:].lstrip()
+
+    return section if section_found else None
 
 
 class Config(NamedTuple):
@@ -67,37 +117,69 @@ class Config(NamedTuple):
     circleci_api_token: Optional[str] = None
 
 
+def _expand_path(value: str) -> Path:
+    return Path(value).expanduser()
+
+
+# Functions casting the config file values, which are strings, to the types of
+# the Config fields
+_CONFIG_COERCERS: Dict[str, Callable[[str], Any]] = {
+    'local_sync_dir': _expand_path,
+    'log_dir': _expand_path,
+    'circleci_api_token': str,
+}
+
+
 def get_config() -> Config:
-    """Return the user's config dictionary."""
-    if not LECIDA_CONFIG_PATH.exists():
+    """Return the user's config dictionary.
+
+    The config file is only parsed again if it was modified since the last
+    call.
+    """
+    try:
+        config_stat = os.stat(LECIDA_CONFIG_PATH)
+    except FileNotFoundError:
         raise ValueError('Config file does not exist. Please run "sriracha '
-                         'configure".')
+                         'configure".') from None
 
-    lecida_config = ConfigParser()
-    lecida_config.read(LECIDA_CONFIG_PATH)
+    return _read_config(path=LECIDA_CONFIG_PATH, inode=config_stat.st_ino,
+                        size=config_stat.st_size,
+                        mtime_ns=config_stat.st_mtime_ns)
 
-    if 'sriracha' not in lecida_config:
+
+@lru_cache(maxsize=1)
+def _read_config(path: Path, inode: int, size: int, mtime_ns: int) -> Config:
+    """Parse a config file.
+
+    The inode, size and modification time of the file are only used as cache
+    keys.
+    """
+    sriracha_config = _read_sriracha_section(path)
+
+    if sriracha_config is None:
         raise ValueError('"sriracha" section not found. Please run "sriracha '
                          'configure".')
 
-    sriracha_config = lecida_config['sriracha']
+    # Values of sriracha_config are string. Cast them if needed
+    config = {key: _CONFIG_COERCERS[key](value)
+              for key, value in sriracha_config.items()}
+
+    return Config(**config)
 
-    config: Dict[str, Union[int, str, Path]] = {}
 
-    # Values of sriracha_config are string. Cast them if needed
-    type_hints = get_type_hints(Config)
-    for key, value in sriracha_config.items():
-        target_type = type_hints[key]
-        if target_type == Optional[Path]:
-            config[key] = Path(value).expanduser()
-        elif target_type == Optional[int]:
-            config[key] = int(value)
-        elif target_type == Optional[str]:
-            config[key] = value
-        else:
-            raise TypeError(f'Unknown target type: {target_type}')
+# Number of seconds during which directories created by
+# _get_default_value_from_ctx are assumed to still exist
+DEFAULT_DIR_CACHE_TTL = 1.0
+
+# time.monotonic() of the last creation of each default directory
+_default_dir_creation_times: Dict[str, float] = {}
 
-    return Config(**config)  # type: ignore
+
+@lru_cache(maxsize=32)
+def _is_local_path(value: str) -> bool:
+    """Return whether a path has no URL scheme nor network location."""
+    parsed = urlparse(value)
+    return parsed.scheme == '' and parsed.netloc == ''
 
 
 def _get_default_value_from_ctx(key: str, default: TOrEmptyString = '',
@@ -107,19 +189,23 @@ def _get_default_value_from_ctx(key: str, default: TOrEmptyString = '',
         # Get the value from the existing dict, or `default` if the value does
         # not exist.
         obj: _ClickContext = click.get_current_context().obj
-        value = obj.lecida_config['sriracha'].get(key, default)
+        value = obj.sriracha_config.get(key, default)
 
         if value and is_dir:
             # Make sure the dir path is a local path and create the directory
             # before returning its path
-            parsed = urlparse(value)
-            if parsed.scheme != '' or parsed.netloc != '':
+            if not _is_local_path(value):
                 raise ValueError(f"{key} cannot be a remote path.")
 
-            path = Path(value).expanduser().absolute()
-            path.mkdir(parents=True, exist_ok=True)
+            path = str(Path(value).expanduser().absolute())
+            now = time.monotonic()
+            creation_time = _default_dir_creation_times.get(path)
+            if (creation_time is None
+                    or now - creation_time >= DEFAULT_DIR_CACHE_TTL):
+                os.makedirs(path, exist_ok=True)
+                _default_dir_creation_times[path] = now
 
-            return str(path)
+            return path
 
         return value
 
@@ -147,10 +233,15 @@ def _get_default_value_from_ctx(key: str, default: TOrEmptyString = '',
     prompt='CircleCI Personal Token',
     default=_get_default_value_from_ctx(key='circleci_api_token')
 )
-@click.pass_obj
-def configure(obj: _ClickContext, **kwargs) -> None:
+def configure(**kwargs) -> None:
     """Configure local directory path for S3 utilities."""
-    config = obj.lecida_config['sriracha']
+    # The whole file is parsed with ConfigParser to write it, so that other
+    # sections are kept
+    lecida_config = ConfigParser()
+    lecida_config.read(LECIDA_CONFIG_PATH)
+    if 'sriracha' not in lecida_config:
+        lecida_config['sriracha'] = {}
+    config = lecida_config['sriracha']
 
     if kwargs.keys() != set(Config._fields):
         raise ValueError(
@@ -168,15 +259,17 @@ def configure(obj: _ClickContext, **kwargs) -> None:
     LECIDA_CONFIG_PATH.parent.mkdir(parents=True, exist_ok=True)
 
     # Set the correct file permissions
-    if LECIDA_CONFIG_PATH.exists():
-        if LECIDA_CONFIG_PATH.stat().st_mode != CONFIG_FILE_PERMISSIONS:
-            LECIDA_CONFIG_PATH.chmod(mode=CONFIG_FILE_PERMISSIONS)
-    else:
+    try:
+        config_stat = os.stat(LECIDA_CONFIG_PATH)
+    except FileNotFoundError:
         LECIDA_CONFIG_PATH.touch(mode=CONFIG_FILE_PERMISSIONS)
+    else:
+        if stat.S_IMODE(config_stat.st_mode) != CONFIG_FILE_PERMISSIONS:
+            LECIDA_CONFIG_PATH.chmod(mode=CONFIG_FILE_PERMISSIONS)
 
     # Write the config file
     with LECIDA_CONFIG_PATH.open('w') as config_file:
-        obj.lecida_config.write(config_file)
+        lecida_config.write(config_file)
 
     logger.info(f'Wrote to {LECIDA_CONFIG_PATH}')
 
@@ -234,27 +327,42 @@ def get_manifest(path: str):
             f"URL scheme should be s3, but received {base_url.geturl()}"
         )
 
-    s3 = boto3.resource("s3")
+    from botocore.exceptions import ClientError
+
+    client = sriracha.remote.get_s3_client()
     manifest_filenames = ["lecida__manifest.yml", "manifest.yml"]
 
-    def read_s3(base_url: ParseResult, filename: str) -> Optional[bytes]:
+    def read_s3(base_url: ParseResult, filename: str) -> Optional[Any]:
         try:
-            obj = s3.Object(
-                bucket_name=base_url.netloc,
-                key=base_url.path.strip("/") + f"/{filename}"
+            obj = client.get_object(
+                Bucket=base_url.netloc,
+                Key=base_url.path.strip("/") + f"/{filename}"
             )
-            return obj.get()['Body'].read()
+            return obj['Body']
         except ClientError as e:
             # Only allow NoSuchKey errors, blow up on any other errors
             if e.response['Error']['Code'] == 'NoSuchKey':
                 return None
             raise e
 
-    body: Optional[bytes] = None
-    for mf in manifest_filenames:
-        body = read_s3(base_url, mf)
-        if body is not None:
-            break
+    # Request all the manifest files at once, but keep the first one found in
+    # the order of manifest_filenames
+    body: Optional[Any] = None
+    with ThreadPoolExecutor(max_workers=len(manifest_filenames)) as executor:
+        futures = [executor.submit(read_s3, base_url, mf)
+                   for mf in manifest_filenames]
+        for mf, future in zip(manifest_filenames, futures):
+            body = future.result()
+            if body is not None:
+                break
+
+    # Release the connections of the other manifest files
+    for future in futures:
+        if future.exception() is None:
+            other_body = future.result()
+            if other_body is not None and other_body is not body:
+                other_body.close()
+
     if body is None:
         raise click.ClickException(
             f"Can't find any manifest files ({manifest_filenames}) in {path}"
@@ -263,4 +371,11 @@ def get_manifest(path: str):
     click.secho(
         f"Found manifest in {base_url.geturl()}/{mf}", fg='green', err=True
     )
-    click.echo(body.decode("utf-8"))
+    # Stream the manifest instead of loading it in memory. click.echo writes
+    # bytes to the binary stdout.
+    try:
+        for chunk in iter(partial(body.read, MANIFEST_BUFFER_SIZE), b''):
+            click.echo(chunk, nl=False)
+    finally:
+        body.close()
+    click.echo()
@@ -10,23 +10,65 @@
 """Remote utilities."""
 from __future__ import annotations
 
+import datetime
 import enum
-import io
+import fnmatch
 import logging
-from contextlib import redirect_stderr
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Optional, Sequence, Union
+from typing import (Any, Dict, Iterable, List, Optional, Pattern, Sequence,
+                    Tuple, Union)
 from urllib.parse import urlparse
 
-import boto3
-import botocore.exceptions
-from awscli.clidriver import create_clidriver
 from typing_extensions import Literal
 
 import sriracha.main
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of concurrent S3 requests of the whole process, shared by all
+# the downloads. Can be overridden with the SRIRACHA_MAX_WORKERS environment
+# variable.
+MAX_CONCURRENCY = int(os.environ.get('SRIRACHA_MAX_WORKERS', '32'))
+
+# Size above which files are downloaded in multiple concurrent parts, instead
+# of being streamed from a single request
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+
+# Size of the buffer used to write streamed files
+DOWNLOAD_BUFFER_SIZE = 1024 * 1024
+
+# Size of the parts of multipart downloads
+MULTIPART_CHUNKSIZE = 16 * 1024 * 1024
+
+# Number of seconds during which S3 paths that were not found are not requested
+# again
+NOT_FOUND_TTL = 5.0
+
+# Maximum number of S3 paths remembered as not found
+NOT_FOUND_MAX_SIZE = 1024
+
+# time.monotonic() expiry of the (bucket, key) pairs that were not found, in
+# insertion order, which is also the expiry order
+_not_found_expiries: OrderedDict[Tuple[str, str], float] = OrderedDict()
+_not_found_lock = threading.Lock()
+
+# S3 client shared by all threads, created on first use
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+# Transfer manager shared by all downloads, created on first use
+_transfer_manager = None
+_transfer_manager_lock = threading.Lock()
+
 
 @enum.unique
 class DownloadMode(enum.IntEnum):
@@ -44,6 +86,88 @@ class DownloadMode(enum.IntEnum):
     NEVER_DOWNLOAD = 4
 
 
+class _ProvideSizeSubscriber(object):
+    """s3transfer subscriber providing the size of the object to download.
+
+    Without it, s3transfer sends a HeadObject request before each download to
+    get the size and the ETag, which are already known from the listing.
+    """
+
+    def __init__(self, size: int, etag: str) -> None:
+        """Initialize the subscriber.
+
+        Args:
+            size: The size of the S3 object.
+            etag: The ETag of the S3 object.
+
+        """
+        self._size = size
+        self._etag = etag
+
+    def on_queued(self, future: Any, **kwargs: Any) -> None:
+        """Provide the size and the ETag when the download is queued."""
+        future.meta.provide_transfer_size(self._size)
+        # Recent s3transfer versions also need the ETag to skip the HeadObject
+        if hasattr(future.meta, 'provide_object_etag'):
+            future.meta.provide_object_etag(self._etag)
+
+
+def _get_transfer_manager():
+    """Return the S3 transfer manager shared by the whole process.
+
+    Its thread pools and the connection pool of the S3 client are reused by
+    all the downloads, instead of being set up again for each of them. Parts
+    and write chunks are larger than the defaults (8 MiB and 256 KiB).
+
+    Returns:
+        An s3transfer TransferManager.
+
+    """
+    global _transfer_manager
+    if _transfer_manager is None:
+        with _transfer_manager_lock:
+            if _transfer_manager is None:
+                from boto3.s3.transfer import (TransferConfig,
+                                               create_transfer_manager)
+
+                config = TransferConfig(
+                    multipart_threshold=MULTIPART_THRESHOLD,
+                    multipart_chunksize=MULTIPART_CHUNKSIZE,
+                    max_concurrency=MAX_CONCURRENCY,
+                    io_chunksize=DOWNLOAD_BUFFER_SIZE,
+                    use_threads=True
+                )
+                _transfer_manager = create_transfer_manager(get_s3_client(),
+                                                            config)
+    return _transfer_manager
+
+
+def get_s3_client():
+    """Return the S3 client shared by the whole process.
+
+    The client is created on the first call, as importing boto3 and creating
+    the client loads the service model and resolves credentials. boto3
+    clients are thread safe, and their connection pool is large enough for
+    MAX_CONCURRENCY concurrent requests.
+
+    Returns:
+        A boto3 S3 client.
+
+    """
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                import botocore.config
+
+                config = botocore.config.Config(
+                    max_pool_connections=MAX_CONCURRENCY
+                )
+                _s3_client = boto3.client("s3", config=config)
+    return _s3_client
+
+
 class InvalidS3Path(Exception):
     """Exception raised when a given S3 path is invalid."""
 
@@ -73,50 +197,18 @@ class InvalidS3Path(Exception):
         return self._reason
 
 
-class AWSCLIException(Exception):
-    """Exception raised by an AWS CLI command."""
-
-    def __init__(self, args: Sequence[str], error_code: int,
-                 stderr: str) -> None:
-        """Initialize the exception.
-
-        Args:
-            args: The AWS CLI command arguments.
-            error_code: The error code returned.
-            stderr: The content of stderr.
-
-        """
-        args_str = ' '.join(args)
-        super().__init__(f'Command aws {args_str} returned error code '
-                         f'{error_code}, with the following stderr:\n{stderr}')
-        self.error_code = error_code
-        self.stderr = stderr
-
-
-def run_aws_cli_command(*args: str):
-    """Return an AWS CLI command, and return an exception if needed."""
-    cli_driver = create_clidriver()
-
-    f_stderr = io.StringIO()
-    with redirect_stderr(f_stderr):
-        return_code = cli_driver.main(args=args)
-
-    stderr = f_stderr.getvalue()
-    f_stderr.close()
-
-    if return_code:
-        raise AWSCLIException(args=args, error_code=return_code, stderr=stderr)
-
-
 def s3_to_local(s3_path: str,
                 sync: Union[bool, None, Literal['if_not_exists']] = None,
                 download_mode: DownloadMode = DownloadMode.SIZE_AND_TIMESTAMP,
                 include_patterns: Optional[Sequence[str]] = None) -> str:
     """Convert an s3 path to the local version.
 
-    Use the local sync directory configured before. Triggers a aws sync call to
-    ensure consistency between S3 and local path if s3_path is a directory in
-    s3. If it is a file, it will download the file using boto3.
+    Use the local sync directory configured before. Syncs the directory, like
+    aws s3 sync, to ensure consistency between S3 and local path if s3_path is
+    a directory in s3. If it is a file, it will download the file using boto3.
+
+    S3 paths with no object are not requested again for NOT_FOUND_TTL
+    seconds, and raise an InvalidS3Path exception right away.
 
     Args:
         s3_path: Path which begins with 's3://'
@@ -160,8 +252,11 @@ def s3_to_local(s3_path: str,
         raise ValueError("Please run 'sriracha configure' to configure "
                          "local sync directory")
 
-    s3_relpath = Path(parsed.netloc, parsed.path.lstrip('/'))
-    local_path = local_sync_dir / s3_relpath
+    bucket = parsed.netloc
+    key = parsed.path.strip('/')
+    # Plain strings are cheaper to build than Path objects
+    local_path = os.path.join(local_sync_dir,
+                              f'{bucket}/{key}' if key else bucket)
 
     if sync:
         if sync is True:
@@ -176,52 +271,198 @@ def s3_to_local(s3_path: str,
                        'the future. Use download_mode instead.')
 
     if download_mode != DownloadMode.NEVER_DOWNLOAD:
-        client = boto3.client("s3")
-        url = urlparse(s3_path)
-
-        if url.scheme != 's3':
+        if parsed.scheme != 's3':
             raise InvalidS3Path(s3_path=s3_path,
                                 reason=InvalidS3Path.Reason.WRONG_SCHEME)
 
-        if not url.netloc:
+        if not bucket:
             raise InvalidS3Path(s3_path=s3_path,
                                 reason=InvalidS3Path.Reason.NO_BUCKET_NAME)
-        bucket = url.netloc
-        key = url.path.strip('/')
 
-        if not key:
-            # S3 path is just the bucket name (i.e. no key passed)
-            _download_s3_dir(local_path, s3_path, download_mode,
-                             include_patterns)
+        if _is_not_found(bucket, key):
+            raise InvalidS3Path(s3_path=s3_path,
+                                reason=InvalidS3Path.Reason.NO_OBJECT_FOUND)
 
-        try:
-            # Try to get object metadata - if successful we have a valid file.
-            client.head_object(Bucket=bucket, Key=key)
+        if (download_mode == DownloadMode.FILE_DOES_NOT_EXIST
+                and include_patterns is None and os.path.isfile(local_path)):
+            # No need to check what the S3 path is
+            return local_path
 
+        kind, obj = _classify(bucket, key)
+        if kind == 'file':
             if include_patterns is not None:
                 raise ValueError('include_patterns are only allowed for directories.')  # noqa: E501
+            _download_s3_file(local_path, bucket, key, size=obj['Size'],
+                              last_modified=obj['LastModified'],
+                              etag=obj['ETag'], download_mode=download_mode)
+        elif kind == 'dir':
+            _download_s3_dir(local_path, bucket, key, download_mode,
+                             include_patterns)
+        else:
+            _add_not_found(bucket, key)
+            raise InvalidS3Path(s3_path=s3_path,
+                                reason=InvalidS3Path.Reason.NO_OBJECT_FOUND)
+        _forget_not_found(bucket, key)
+
+    return local_path
+
+
+def _is_not_found(bucket: str, key: str) -> bool:
+    """Return whether an S3 path was not found less than NOT_FOUND_TTL ago."""
+    with _not_found_lock:
+        expiry = _not_found_expiries.get((bucket, key))
+        if expiry is None:
+            return False
+        if time.monotonic() < expiry:
+            return True
+        del _not_found_expiries[bucket, key]
+        return False
+
+
+def _add_not_found(bucket: str, key: str) -> None:
+    """Remember that an S3 path was not found, for NOT_FOUND_TTL seconds.
+
+    Expired entries are evicted, as well as the oldest ones when there are
+    more than NOT_FOUND_MAX_SIZE.
+    """
+    now = time.monotonic()
+    with _not_found_lock:
+        _not_found_expiries.pop((bucket, key), None)
+        _not_found_expiries[bucket, key] = now + NOT_FOUND_TTL
+        while True:
+            oldest_expiry = next(iter(_not_found_expiries.values()))
+            if (oldest_expiry > now
+                    and len(_not_found_expiries) <= NOT_FOUND_MAX_SIZE):
+                break
+            _not_found_expiries.popitem(last=False)
+
+
+def _forget_not_found(bucket: str, key: str) -> None:
+    """Forget the S3 paths not found at or under a downloaded S3 path."""
+    prefix = f'{key}/' if key else ''
+    with _not_found_lock:
+        not_found = [(b, k) for b, k in _not_found_expiries
+                     if b == bucket and (k == key or k.startswith(prefix))]
+        for bucket_key in not_found:
+            del _not_found_expiries[bucket_key]
+
+
+def s3_to_local_many(
+        s3_paths: Iterable[str],
+        download_mode: DownloadMode = DownloadMode.SIZE_AND_TIMESTAMP,
+        include_patterns: Optional[Sequence[str]] = None,
+        max_workers: Optional[int] = None
+) -> List[str]:
+    """Convert multiple s3 paths to their local versions.
+
+    Runs s3_to_local on each path from a thread pool, so that the S3 requests
+    of the different paths overlap.
+
+    Args:
+        s3_paths: Paths which begin with 's3://', or local paths.
+        download_mode: The download decision behavior. See the documentation
+            of `s3_to_local`. Defaults to SIZE_AND_TIMESTAMP.
+        include_patterns: A list of patterns to include, for the paths that
+            are directories. See the documentation of `s3_to_local`. Defaults
+            to None.
+        max_workers: The maximum number of threads. If None, uses the default
+            of concurrent.futures.ThreadPoolExecutor.
+
+    Returns:
+        The local paths, in the same order as s3_paths.
+
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(
+            partial(s3_to_local, download_mode=download_mode,
+                    include_patterns=include_patterns),
+            s3_paths
+        ))
+
 
-            _download_s3_file(local_path, s3_path, download_mode)
-        except botocore.exceptions.ClientError as e:
-            # If we get a 404 back then we're dealing with an S3 directory
-            if e.response['ResponseMetadata']['HTTPStatusCode'] == 404:
-                _download_s3_dir(local_path, s3_path, download_mode,
-                                 include_patterns)
-            else:
-                raise e
+def _classify(bucket: str, key: str) \
+        -> Tuple[Literal['file', 'dir', 'missing'], Dict[str, Any]]:
+    """Find out whether an S3 path is a file, a directory, or missing.
 
-    return str(local_path)
+    Uses a single list_objects_v2 request in most cases: keys are listed in
+    lexicographic order, so an object with exactly this key is always listed
+    first. If a sibling key such as "key-suffix" is listed first instead, the
+    directory marker "key/" is probed with head_object, and only if it does not
+    exist are the keys under "key/" listed.
+
+    Args:
+        bucket: The S3 bucket name.
+        key: The S3 key, without leading or trailing slashes.
+
+    Returns:
+        "file" if there is an object with this key, "dir" if there are only
+        objects starting with this key, and "missing" otherwise, along with the
+        first listed object, or an empty dictionary if there is none.
+
+    """
+    import botocore.exceptions
+
+    # Only used in exceptions
+    s3_path = f's3://{bucket}/{key}'
+
+    try:
+        response = get_s3_client().list_objects_v2(Bucket=bucket, Prefix=key,
+                                                   MaxKeys=1)
+    except botocore.exceptions.ClientError as e:
+        error_code = e.response['Error']['Code']
+        if error_code == 'InvalidBucketName':
+            raise InvalidS3Path(s3_path=s3_path,
+                                reason=InvalidS3Path.Reason.INVALID_BUCKET_NAME)  # noqa: E501
+        elif error_code == 'NoSuchBucket':
+            raise InvalidS3Path(s3_path=s3_path,
+                                reason=InvalidS3Path.Reason.NO_SUCH_BUCKET)
+        else:
+            raise e
+
+    objects = response.get('Contents')
+    if not objects:
+        return 'missing', {}
+    if not key:
+        return 'dir', objects[0]
+    if objects[0]['Key'] == key:
+        return 'file', objects[0]
+
+    prefix = f'{key}/'
+    if objects[0]['Key'].startswith(prefix):
+        return 'dir', objects[0]
+
+    # Keys such as "key-suffix" are listed before "key/", check the
+    # directory marker first, since a HEAD is cheaper than a LIST
+    try:
+        get_s3_client().head_object(Bucket=bucket, Key=prefix)
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+            raise e
+    else:
+        return 'dir', {'Key': prefix}
+
+    response = get_s3_client().list_objects_v2(Bucket=bucket, Prefix=prefix,
+                                               MaxKeys=1)
+    objects = response.get('Contents')
+    if not objects:
+        return 'missing', {}
+    return 'dir', objects[0]
 
 
 def _download_s3_file(
-        local_path: Path, s3_path: str,
+        local_path: str, bucket: str, key: str, size: int,
+        last_modified: datetime.datetime, etag: str,
         download_mode: DownloadMode = DownloadMode.SIZE_AND_TIMESTAMP
 ) -> None:
     """Download a file from S3 using the boto3 library.
 
     Args:
         local_path: Directory or file path where the data will reside locally
-        s3_path: Path which begins with 's3://'
+        bucket: The S3 bucket name.
+        key: The S3 key, without leading or trailing slashes.
+        size: The size of the S3 object.
+        last_modified: The modification time of the S3 object.
+        etag: The ETag of the S3 object.
         download_mode: The download decision behavior. Could be one of these
             enum values:
             - ALWAYS_DOWNLOAD: Always download, even if the destination file
@@ -239,51 +480,86 @@ def _download_s3_file(
             Defaults to SIZE_AND_TIMESTAMP.
 
     """
-    if (download_mode == DownloadMode.FILE_DOES_NOT_EXIST and local_path.exists()):  # noqa: E501
+    if _is_up_to_date(local_stat=_stat_if_exists(local_path), size=size,
+                      last_modified=last_modified,
+                      download_mode=download_mode):
         return
 
-    s3 = boto3.resource("s3")
-    parsed = urlparse(s3_path)
-    bucket = s3.Bucket(parsed.netloc)
+    local_dir = os.path.dirname(local_path)
+    os.makedirs(local_dir, exist_ok=True)
 
-    # make sure local parent dir is created
-    key = parsed.path.strip('/')
+    import botocore.exceptions
 
-    s3_obj = bucket.Object(key=key)
+    client = get_s3_client()
+    try:
+        if size > MULTIPART_THRESHOLD:
+            # Large objects are downloaded in concurrent parts
+            _get_transfer_manager().download(
+                bucket, key, local_path,
+                subscribers=[_ProvideSizeSubscriber(size, etag)]
+            ).result()
+        else:
+            # Small objects are streamed from a single request
+            response = client.get_object(Bucket=bucket, Key=key)
+            last_modified = response['LastModified']
+            _write_body(local_path, response['Body'])
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+            raise e
+        # The object was deleted since it was listed
+        raise InvalidS3Path(s3_path=f's3://{bucket}/{key}',
+                            reason=InvalidS3Path.Reason.NO_OBJECT_FOUND)
 
-    if (local_path.exists() and download_mode in (DownloadMode.SIZE_ONLY, DownloadMode.SIZE_AND_TIMESTAMP)):  # noqa: E501
-        stat = local_path.stat()
+    # Same as directory syncs, so that timestamps can be compared later on
+    mtime = last_modified.timestamp()
+    os.utime(local_path, (mtime, mtime))
 
-        if s3_obj.content_length == stat.st_size:
-            if download_mode == DownloadMode.SIZE_ONLY:
-                return
 
-            if s3_obj.last_modified.timestamp() == stat.st_mtime:
-                return
+def _write_body(local_path: str, body: Any) -> None:
+    """Write the body of an S3 object to a file.
 
-    local_path.parent.mkdir(parents=True, exist_ok=True)
+    The body is written to a temporary file first, so that local_path is never
+    partially written. Contrary to tempfile, which restricts it to 0600, the
+    file mode follows the umask like s3transfer downloads.
 
+    Args:
+        local_path: The path of the file.
+        body: The streaming body of the S3 object, closed once written.
+
+    """
+    tmp_path = os.path.join(
+        os.path.dirname(local_path),
+        f'.{os.path.basename(local_path)}.{uuid.uuid4().hex}'
+    )
     try:
-        s3_obj.download_file(str(local_path))
-    except botocore.exceptions.ClientError as e:
-        error_code = e.response['Error']['Code']
-        if error_code == '404':
-            raise InvalidS3Path(
-                s3_path=s3_path, reason=InvalidS3Path.Reason.NO_OBJECT_FOUND
-            ) from e
-        raise e
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(body, f, length=DOWNLOAD_BUFFER_SIZE)
+            os.replace(tmp_path, local_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    finally:
+        body.close()
 
 
 def _download_s3_dir(
-        local_path: Path, s3_path: str,
+        local_path: str, bucket: str, key: str,
         download_mode: DownloadMode = DownloadMode.SIZE_AND_TIMESTAMP,
         include_patterns: Optional[Sequence[str]] = None
 ) -> None:
-    """Download a directory from S3 using the AWS CLI s3 cp sync command.
+    """Sync a directory from S3, similarly to the AWS CLI s3 sync command.
+
+    Objects are listed with boto3, and only the ones that need to be
+    downloaded according to download_mode are downloaded, concurrently. The
+    modification time of downloaded files is set to the one of their S3
+    object, so that they are not downloaded again by the next syncs.
 
     Args:
         local_path: Directory or file path where the data will reside locally
-        s3_path: Path which begins with 's3://'
+        bucket: The S3 bucket name.
+        key: The S3 key, without leading or trailing slashes.
         download_mode: The download decision behavior. Could be one of these
             enum values:
             - ALWAYS_DOWNLOAD: Always download, even if the destination file
@@ -311,39 +587,107 @@ def _download_s3_dir(
                        'SIZE_AND_TIMESTAMP download mode.')
         download_mode = DownloadMode.SIZE_AND_TIMESTAMP
 
-    additional_args = []
-    if download_mode == DownloadMode.SIZE_ONLY:
-        additional_args.append('--size-only')
-    elif download_mode == DownloadMode.SIZE_AND_TIMESTAMP:
-        additional_args.append('--exact-timestamps')
-    else:
+    if download_mode not in (DownloadMode.SIZE_ONLY,
+                             DownloadMode.SIZE_AND_TIMESTAMP):
         raise ValueError(f'Download mode not understood: {download_mode}')
 
+    client = get_s3_client()
+    # Same as the AWS CLI, the key is the name of a directory
+    prefix = f'{key}/' if key else ''
+    matcher = (None if include_patterns is None
+               else _compile_patterns(tuple(include_patterns)))
+    downloads = []
+    manager = _get_transfer_manager()
     try:
-        s3 = boto3.resource("s3")
-        url = urlparse(s3_path)
-        bucket_name = url.netloc
-        bucket = s3.Bucket(bucket_name)
-        key = url.path.strip('/')
-        objects = list(bucket.objects.filter(Prefix=key).limit(1))
-    except botocore.exceptions.ClientError as e:
-        error_code = e.response['Error']['Code']
-        if error_code == 'InvalidBucketName':
-            raise InvalidS3Path(s3_path=s3_path,
-                                reason=InvalidS3Path.Reason.INVALID_BUCKET_NAME)  # noqa: E501
-        elif error_code == 'NoSuchBucket':
-            raise InvalidS3Path(s3_path=s3_path,
-                                reason=InvalidS3Path.Reason.NO_SUCH_BUCKET)
-        else:
-            raise e
+        paginator = client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', ()):
+                rel_key = obj['Key'][len(prefix):]
+                if not rel_key or rel_key.endswith('/'):
+                    # Directory marker
+                    continue
+                if matcher is not None and not matcher.match(rel_key):
+                    continue
+
+                obj_local_path = os.path.join(local_path, rel_key)
+                if _is_up_to_date(local_stat=_stat_if_exists(obj_local_path),
+                                  size=obj['Size'],
+                                  last_modified=obj['LastModified'],
+                                  download_mode=download_mode):
+                    continue
+
+                os.makedirs(os.path.dirname(obj_local_path), exist_ok=True)
+                future = manager.download(
+                    bucket, obj['Key'], obj_local_path,
+                    subscribers=[_ProvideSizeSubscriber(obj['Size'],
+                                                        obj['ETag'])]
+                )
+                downloads.append((future, obj_local_path,
+                                  obj['LastModified']))
+
+        for future, obj_local_path, last_modified in downloads:
+            future.result()
+            mtime = last_modified.timestamp()
+            os.utime(obj_local_path, (mtime, mtime))
+    except BaseException:
+        # The manager is shared, only cancel the downloads of this sync
+        for future, _, _ in downloads:
+            future.cancel()
+        raise
+
+
+@lru_cache(maxsize=32)
+def _compile_patterns(patterns: Tuple[str, ...]) -> Pattern[str]:
+    """Compile glob patterns into a single regular expression.
 
-    if len(objects) == 0:
-        raise InvalidS3Path(s3_path=s3_path,
-                            reason=InvalidS3Path.Reason.NO_OBJECT_FOUND)
+    Args:
+        patterns: The glob patterns, as understood by fnmatch.fnmatchcase.
 
-    if include_patterns is not None:
-        additional_args += ['--exclude', '*']
-        for pattern in include_patterns:
-            additional_args += ['--include', pattern]
+    Returns:
+        A regular expression matching the strings that match any of the
+        patterns.
 
-    run_aws_cli_command('s3', 'sync', s3_path, str(local_path), *additional_args)  # noqa: E501
+    """
+    if not patterns:
+        # Never matches
+        return re.compile('(?!)')
+    return re.compile('|'.join(map(fnmatch.translate, patterns)))
+
+
+def _stat_if_exists(path: Union[str, Path]) -> Optional[os.stat_result]:
+    """Return the stat result of a path, or None if it does not exist."""
+    try:
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+def _is_up_to_date(local_stat: Optional[os.stat_result], size: int,
+                   last_modified: datetime.datetime,
+                   download_mode: DownloadMode) -> bool:
+    """Return whether a local file does not need to be downloaded again.
+
+    Args:
+        local_stat: The stat result of the local file, or None if it does not
+            exist.
+        size: The size of the S3 object.
+        last_modified: The modification time of the S3 object.
+        download_mode: The download decision behavior. See the documentation
+            of `s3_to_local`.
+
+    Returns:
+        Whether the local file is up to date, according to download_mode.
+
+    """
+    if download_mode == DownloadMode.ALWAYS_DOWNLOAD:
+        return False
+    if download_mode == DownloadMode.NEVER_DOWNLOAD:
+        return True
+    if local_stat is None:
+        return False
+    if download_mode == DownloadMode.FILE_DOES_NOT_EXIST:
+        return True
+    if local_stat.st_size != size:
+        return False
+    return (download_mode == DownloadMode.SIZE_ONLY
+            or last_modified.timestamp() == local_stat.st_mtime)
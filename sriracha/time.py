@@ -9,7 +9,6 @@
 # prior written permission is obtained from Lecida Inc.
 """Time utilities."""
 
-import itertools
 import logging
 from datetime import datetime, timedelta
 from typing import Optional, Sequence, Tuple, Union
@@ -22,19 +21,63 @@ logger = logging.getLogger(__name__)
 TSType = Union[pd.Timestamp, str, np.datetime64, datetime]
 TDType = Union[pd.Timedelta, str, np.timedelta64, timedelta]
 
+# Format of the strings returned by time_to_string
+TIME_STRING_FORMAT = '%Y-%m-%dT%H-%M-%S-%f'
+
+# Number of nanoseconds in a day, the unit of pd.Timedelta.value
+NANOSECONDS_PER_DAY = 24 * 60 * 60 * 10**9
+
+# Origin of days_since_epoch
+EPOCH = np.datetime64('1970-01-01', 'ns')
+
+
+def _to_datetime(ts: TSType) -> datetime:
+    """Convert a timestamp to a datetime, with microsecond precision.
+
+    pd.Timestamp objects are datetimes already, and NumPy datetime64 are
+    converted directly, only strings and out of range values are parsed with
+    pandas. NaT values are all returned as pd.NaT.
+    """
+    if isinstance(ts, datetime):
+        return ts
+    if isinstance(ts, np.datetime64):
+        dt = ts.astype('datetime64[us]').item()
+        if isinstance(dt, datetime):
+            return dt
+    return pd.Timestamp(ts)
+
 
 def time_to_string(ts: TSType) -> str:
     """Convert a timestamp to string format: %Y-%m-%dT%H-%M-%S-%f."""
-    return f'{pd.Timestamp(ts):%Y-%m-%dT%H-%M-%S-%f}'
+    dt = _to_datetime(ts)
+    if dt is pd.NaT:
+        # NaT is a datetime instance, but only its own methods handle it
+        return dt.strftime(TIME_STRING_FORMAT)
+    # The datetime methods are called directly, as pd.Timestamp overrides them
+    return datetime.strftime(dt, TIME_STRING_FORMAT)
 
 
 def time_to_isoformat(ts: TSType) -> str:
     """Convert a timestamp to ISO format."""
-    return pd.Timestamp(ts).to_pydatetime().isoformat()
+    dt = _to_datetime(ts)
+    if dt is pd.NaT:
+        return dt.isoformat()
+    return datetime.isoformat(dt)
+
 
+def _to_datetime64(ts: TSType) -> np.datetime64:
+    """Convert a timestamp to a NumPy datetime64.
 
-def is_overlapping(segs: pd.DataFrame, start: TSType, end: TSType) \
-        -> pd.Series:
+    pd.Timestamp objects already hold one, which is much faster to get than
+    converting them with np.datetime64.
+    """
+    if isinstance(ts, pd.Timestamp):
+        return ts.asm8
+    return np.datetime64(ts)
+
+
+def is_overlapping(segs: pd.DataFrame, start: TSType, end: TSType,
+                   assume_sorted: bool = False) -> pd.Series:
     """Return a boolean array indicating boolean segments.
 
     Args:
@@ -42,12 +85,29 @@ def is_overlapping(segs: pd.DataFrame, start: TSType, end: TSType) \
             'end_timestamp'
         start: start timestamp for query segment
         end: end timestamp for query segment
+        assume_sorted: Whether both the start and end timestamps of segs are
+            sorted, as with the segments returned by get_segments. If True,
+            the overlapping segments are found with binary searches instead of
+            comparing all the segments. Defaults to False.
 
     Returns:
         A series of boolean.
 
     """
-    return ~((segs.end_timestamp < start) | (segs.start_timestamp > end))
+    if not assume_sorted:
+        return ~((segs.end_timestamp < start) | (segs.start_timestamp > end))
+
+    # The overlapping segments are the ones after the last segment ending
+    # before start, and before the first segment starting after end
+    first_index = segs.end_timestamp.values.searchsorted(
+        _to_datetime64(start), side='left'
+    )
+    end_index = segs.start_timestamp.values.searchsorted(
+        _to_datetime64(end), side='right'
+    )
+    overlapping = np.zeros(segs.shape[0], dtype=bool)
+    overlapping[first_index:end_index] = True
+    return pd.Series(overlapping, index=segs.index)
 
 
 def timedelta_to_days(td: TDType) -> float:
@@ -60,6 +120,14 @@ def timedelta_to_days(td: TDType) -> float:
         The number of days in this timedelta.
 
     """
+    # Fast paths, without building pd.Timedelta objects
+    if isinstance(td, pd.Timedelta):
+        return td.value / NANOSECONDS_PER_DAY
+    if isinstance(td, timedelta):
+        return td / timedelta(days=1)
+    if isinstance(td, np.timedelta64):
+        # Like pd.Timedelta, which treats generic units as nanoseconds
+        return float(td.astype('timedelta64[ns]') / np.timedelta64(1, 'D'))
     return pd.Timedelta(td) / pd.Timedelta(days=1)
 
 
@@ -73,8 +141,11 @@ def timedelta_arr_to_days(td_arr: Sequence[TDType]) -> np.ndarray:
         An array containing the number of days in each timedelta.
 
     """
-    return (pd.Series(td_arr, dtype=np.dtype('timedelta64[ns]'))
-            / pd.Timedelta(days=1)).values
+    td_values = np.asarray(td_arr)
+    if td_values.dtype.kind != 'm':
+        # Python timedeltas, strings, etc. need to be parsed by pandas
+        td_values = pd.to_timedelta(td_values).values
+    return td_values / np.timedelta64(1, 'D')
 
 
 def get_timerange_indices(timestamps: Union[pd.Series, np.ndarray],
@@ -91,17 +162,21 @@ def get_timerange_indices(timestamps: Union[pd.Series, np.ndarray],
         The start and end indices for the timerange.
 
     """
-    start_time, end_time = np.datetime64(start_time), np.datetime64(end_time)
-
     if isinstance(timestamps, pd.Series):
         # Converting to NumPy
         timestamps = timestamps.values
 
     if len(timestamps.shape) > 1:
         timestamps = np.squeeze(timestamps, axis=1)
-    start_index = np.searchsorted(timestamps, start_time, side='left')
-    end_index = np.searchsorted(timestamps, end_time, side='right')
-    return start_index, end_index
+
+    # The ndarray method skips the dispatch of the np.searchsorted function.
+    # bisect is only faster on a memoryview of the int64 timestamps built
+    # beforehand, building it on each call costs more than the search.
+    start_index = timestamps.searchsorted(_to_datetime64(start_time),
+                                          side='left')
+    end_index = timestamps.searchsorted(_to_datetime64(end_time),
+                                        side='right')
+    return int(start_index), int(end_index)
 
 
 def get_segments(errors: Sequence[float],
@@ -123,17 +198,24 @@ def get_segments(errors: Sequence[float],
         The DataFrame of segments.
 
     """
-    sparse_index = pd.SparseArray(errors, fill_value=ignore_value).sp_index
-    sparse_block_index = sparse_index.to_block_index()
-
-    start_indices = sparse_block_index.blocs
+    errors_arr = np.asarray(errors)
+    if isinstance(ignore_value, float) and np.isnan(ignore_value):
+        mask = ~pd.isna(errors_arr)
+    else:
+        mask = errors_arr != ignore_value
+
+    # Segments start where the mask goes from False to True, and end where it
+    # goes from True to False
+    padded_mask = np.concatenate(([False], mask, [False]))
+    changes = np.flatnonzero(padded_mask[1:] != padded_mask[:-1])
+    start_indices = changes[0::2]
     # end_indices are NOT inclusive
-    end_indices = sparse_block_index.blocs + sparse_block_index.blengths
-    items = [
-        ("start_index", start_indices),
-        ("end_index", end_indices),
-        ("index_length", sparse_block_index.blengths),
-    ]
+    end_indices = changes[1::2]
+    columns = {
+        "start_index": start_indices,
+        "end_index": end_indices,
+        "index_length": end_indices - start_indices,
+    }
 
     if timestamps is not None:
         timestamps_arr = np.asarray(timestamps, dtype='datetime64[ns]')
@@ -141,15 +223,14 @@ def get_segments(errors: Sequence[float],
         # end timestamps ARE inclusive
         end_timestamps = timestamps_arr[end_indices - 1]
         delta_days = timedelta_arr_to_days(end_timestamps - start_timestamps)
-        items.extend([
-            ("start_timestamp", start_timestamps),
-            ("end_timestamp", end_timestamps),
-            ("delta_days", delta_days),
-        ])
+        columns.update({
+            "start_timestamp": start_timestamps,
+            "end_timestamp": end_timestamps,
+            "delta_days": delta_days,
+        })
 
-    df = pd.DataFrame({k: v for k, v in items}, columns=[k for k, v in items])
-
-    return df
+    # Dictionaries are ordered, so are the columns
+    return pd.DataFrame(columns)
 
 
 def coalesce_segments(segments_df: pd.DataFrame,
@@ -171,28 +252,23 @@ def coalesce_segments(segments_df: pd.DataFrame,
 
     start_timestamps = segments_df['start_timestamp']
     end_timestamps = segments_df['end_timestamp']
-    diffs = start_timestamps[1:] - end_timestamps[:-1].values
-    diffs.name = None
+    diffs = start_timestamps.values[1:] - end_timestamps.values[:-1]
 
     # convert to timedelta
-    coalesce_interval_td = timedelta(days=coalesce_interval_days)
+    coalesce_interval_td = np.timedelta64(
+        timedelta(days=coalesce_interval_days)
+    )
     mask = (diffs < coalesce_interval_td)
-    coalesced_segments = get_segments(mask, None, False)
-
-    start_indices = list(coalesced_segments['start_index'])
-    # Here we add 1 because we take segments of diffs
-    # which tell us that the end index is included
-    end_indices = list(coalesced_segments['start_index']
-                       + coalesced_segments['index_length'] + 1)
-    # add back the segments that are far away from others
-    segments_covered = set(itertools.chain.from_iterable(
-        (range(a, b) for a, b in zip(start_indices, end_indices))))
-    additional_segment_idxs = np.asarray(
-        [i for i in range(segments_df.shape[0]) if i not in segments_covered])
-    start_indices_arr = np.asarray(sorted(start_indices
-                                          + list(additional_segment_idxs)))
-    end_indices_arr = np.asarray(sorted(end_indices
-                                        + list(additional_segment_idxs + 1)))
+    if not mask.any():
+        # No segments to coalesce
+        return segments_df.copy()
+
+    # Each segment starts a new coalesced segment, unless it is close enough
+    # to the previous one. This gives the (segment) indices of the first and
+    # last segments of each coalesced segment in a single pass.
+    start_indices_arr = np.flatnonzero(np.concatenate(([True], ~mask)))
+    # end_indices_arr are NOT inclusive
+    end_indices_arr = np.append(start_indices_arr[1:], segments_df.shape[0])
 
     new_start_indices = (segments_df['start_index'].iloc[start_indices_arr]
                          .values)
@@ -201,22 +277,21 @@ def coalesce_segments(segments_df: pd.DataFrame,
     if np.any(new_lengths == 0):
         logger.warning("There are some start_index==end_index in given "
                        "segments to coalesce, which may cause problems.")
-    items = [
-        ("start_index", new_start_indices),
-        ("end_index", new_end_indices),
-        ("index_length", new_lengths),
-    ]
+    columns = {
+        "start_index": new_start_indices,
+        "end_index": new_end_indices,
+        "index_length": new_lengths,
+    }
 
     start_timestamps = start_timestamps.values[start_indices_arr]
     end_timestamps = end_timestamps.values[end_indices_arr - 1]
     delta_days = timedelta_arr_to_days(end_timestamps - start_timestamps)
-    items.extend([
-        ("start_timestamp", start_timestamps),
-        ("end_timestamp", end_timestamps),
-        ("delta_days", delta_days),
-    ])
-    df = pd.DataFrame({k: v for k, v in items}, columns=[k for k, v in items])
-    return df
+    columns.update({
+        "start_timestamp": start_timestamps,
+        "end_timestamp": end_timestamps,
+        "delta_days": delta_days,
+    })
+    return pd.DataFrame(columns)
 
 
 def days_since_epoch(timestamps: Union[pd.Series, np.ndarray]) -> np.ndarray:
@@ -229,5 +304,6 @@ def days_since_epoch(timestamps: Union[pd.Series, np.ndarray]) -> np.ndarray:
         The array of days-since-epoch.
 
     """
-    return timedelta_arr_to_days(timestamps
-                                 - np.datetime64(pd.datetime(1970, 1, 1)))
+    return timedelta_arr_to_days(
+        np.asarray(timestamps, dtype='datetime64[ns]') - EPOCH
+    )
@@ -18,13 +18,28 @@ from uuid import UUID, uuid5
 
 import yaml
 
+try:
+    # libyaml based, much faster
+    from yaml import CSafeDumper as _BaseDumper
+    from yaml import CSafeLoader as _BaseLoader
+except ImportError:
+    from yaml import SafeDumper as _BaseDumper
+    from yaml import SafeLoader as _BaseLoader
+
 logger = logging.getLogger(__name__)
 
 LECIDA_YAML_UUID_NAMESPACE = UUID(int=0x7ec1daeda7c85497884b838a21f1b17e,
                                   version=5)
 
+# Types of YAML scalars, which _Constructor._parameter_representation returns
+# unchanged
+_SCALAR_TYPES = frozenset((str, int, float, bool, type(None)))
+
+# YAML tag → target class of the registered YAMLRegistered subclasses
+_yaml_tag_mapping: Dict[str, Type[YAMLRegistered]] = {}
+
 
-class Loader(yaml.SafeLoader):
+class Loader(_BaseLoader):
     """YAML safe loader with custom Lecida tags."""
 
     ...
@@ -53,6 +68,10 @@ class _Constructor():
                 dicts.
 
         """
+        # Most parameters are scalars, recognized with a single set lookup
+        if type(value) in _SCALAR_TYPES:
+            return value
+
         if isinstance(value, YAMLRegistered):
             return f'{value.input_yaml_tag}#{value.input_hash}'
 
@@ -64,7 +83,7 @@ class _Constructor():
                         for k, v in value.items()}
         return value
 
-    def __call__(self, loader: yaml.SafeLoader, node: yaml.Node) \
+    def __call__(self, loader: _BaseLoader, node: yaml.Node) \
             -> YAMLRegistered:
         """YAML constructor for this subclass."""
         if not isinstance(loader, Loader):
@@ -87,7 +106,15 @@ class _Constructor():
         )
 
         instance._yaml_input_node = node
+        # Hashed once here, as repr walks the whole node tree
+        instance._yaml_input_hash = str(uuid5(
+            namespace=LECIDA_YAML_UUID_NAMESPACE, name=repr(node)
+        ))
         instance._yaml_input_params = self._parameter_representation(kwargs)
+        instance._yaml_input_params_repr = ','.join(
+            f'{k}={v}'
+            for k, v in sorted(instance._yaml_input_params.items())
+        )
 
         try:
             instance.__init__(**kwargs)
@@ -102,7 +129,9 @@ class YAMLRegistered(object):
     """Object that is automatically registered for YAML EDA config. files."""
 
     _yaml_input_node: yaml.nodes.Node
+    _yaml_input_hash: str
     _yaml_input_params: Dict[str, Any]
+    _yaml_input_params_repr: str
 
     def __init_subclass__(cls, register_yaml: bool = True,
                           yaml_tag: Optional[str] = None) -> None:
@@ -146,6 +175,7 @@ class YAMLRegistered(object):
             constructor = _Constructor(target_cls=cls)
             Loader.add_constructor(tag=yaml_tag,
                                    constructor=constructor)
+            _yaml_tag_mapping[yaml_tag] = cls
 
             logger.debug(f'Registered YAML Tag {yaml_tag} for {cls}.')
 
@@ -187,22 +217,19 @@ class YAMLRegistered(object):
     @property
     def input_hash(self) -> str:
         """Return the hash of the YAML input node."""
-        return str(uuid5(namespace=LECIDA_YAML_UUID_NAMESPACE,
-                         name=repr(self._yaml_input_node)))
+        return self._yaml_input_hash
 
     def __repr__(self) -> str:
         """Return the representation of the object."""
-        params_string = ','.join(
-            f'{k}={v}' for k, v in sorted(self._yaml_input_params.items())
-        )
-        return f'{self.input_yaml_tag}#{self.input_hash}({params_string})'
+        return (f'{self.input_yaml_tag}#{self.input_hash}'
+                f'({self._yaml_input_params_repr})')
 
     def __str__(self) -> str:
         """Return the short representation of the object."""
         return f'{self.input_yaml_tag}#{self.input_hash[:8]}'
 
 
-class Dumper(yaml.SafeDumper):
+class Dumper(_BaseDumper):
     """YAML Dumper that can represent any Lecida YAML registered object."""
 
     def __init__(self, *args, **kwargs) -> None:
@@ -227,12 +254,11 @@ def get_lecida_yaml_tag_mapping(filter_prefix: str = '') \
         The YAML tag → Corresponding target class mapping.
 
     """
-    return {
-        yaml_tag: constructor.target_cls
-        for yaml_tag, constructor in yaml.SafeLoader.yaml_constructors.items()
-        if (isinstance(constructor, _Constructor)
-            and yaml_tag.startswith(filter_prefix))
-    }
+    if not filter_prefix:
+        return _yaml_tag_mapping.copy()
+    return {yaml_tag: target_cls
+            for yaml_tag, target_cls in _yaml_tag_mapping.items()
+            if yaml_tag.startswith(filter_prefix)}
 
 
 load = partial(yaml.load, Loader=Loader)
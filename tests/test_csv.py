@@ -9,6 +9,7 @@
 # prior written permission is obtained from Lecida Inc.
 """Test for Sriracha CSV utils."""
 
+import os
 from pathlib import Path
 from typing import Iterable, List
 
@@ -52,6 +53,22 @@ def test_different_field_names_than_existing(tmp_path: Path) -> None:
             pass
 
 
+@pytest.mark.skipif(not os.path.isdir('/proc/self/fd'),
+                    reason='Open file descriptors cannot be listed')
+def test_existing_file_not_kept_open(tmp_path: Path) -> None:
+    csv_path = tmp_path / 'test.csv'
+    csv_path.write_bytes(b'a,b\n1,2\n')
+    open_fds = os.listdir('/proc/self/fd')
+
+    scsv.CSVWriter(path=csv_path)
+    assert os.listdir('/proc/self/fd') == open_fds
+
+    csv_path.write_bytes(b'\xff,b\n1,2\n')
+    with pytest.raises(UnicodeDecodeError):
+        scsv.CSVWriter(path=csv_path)
+    assert os.listdir('/proc/self/fd') == open_fds
+
+
 def test_custom_field_names(tmp_path: Path) -> None:
     csv_path = tmp_path / 'test.csv'
 
@@ -109,3 +126,91 @@ def test_write_columns(tmp_path: Path) -> None:
 
     file_content = csv_path.read_text()
     assert file_content == 'a,b\n2,c\n3,6\n4,4\n'
+
+
+def test_line_buffering(tmp_path: Path) -> None:
+    csv_path = tmp_path / 'test.csv'
+
+    with scsv.CSVWriter(path=csv_path, use_line_buffering=True) \
+            as csv_writer:
+        csv_writer.write_row(a=1, b=2)
+        assert csv_path.read_text() == 'a,b\n1,2\n'
+
+
+@pytest.mark.parametrize('background_writes', (False, True))
+def test_write_rows_multiple_batches(monkeypatch, tmp_path: Path,
+                                     background_writes: bool) -> None:
+    csv_path = tmp_path / 'test.csv'
+    monkeypatch.setattr(scsv, 'ROWS_PER_BATCH', 2)
+
+    with scsv.CSVWriter(path=csv_path, background_writes=background_writes) \
+            as csv_writer:
+        csv_writer.write_rows(rows=({'a': i, 'b': -i} for i in range(3)))
+        csv_writer.write_row(a=3, b=-3)
+        csv_writer.write_columns(a=[4], b=[-4])
+
+    file_content = csv_path.read_text()
+    assert file_content == 'a,b\n0,0\n1,-1\n2,-2\n3,-3\n4,-4\n'
+
+
+def test_single_field_and_missing_values(tmp_path: Path) -> None:
+    csv_path = tmp_path / 'test.csv'
+
+    with scsv.CSVWriter(path=csv_path) as csv_writer:
+        csv_writer.write_row(a=1)
+        csv_writer.write_rows(rows=[{'a': 2}, {}])
+
+    with scsv.CSVWriter(path=csv_path) as csv_writer:
+        with pytest.raises(ValueError):
+            csv_writer.write_row(b=1)
+
+    file_content = csv_path.read_text()
+    assert file_content == 'a\n1\n2\n""\n'
+
+
+def test_existing_header_without_rows(tmp_path: Path) -> None:
+    csv_path = tmp_path / 'test.csv'
+    csv_path.write_text('b,a\n')
+
+    with scsv.CSVWriter(path=csv_path) as csv_writer:
+        csv_writer.write_row(a=1, b=2)
+
+    file_content = csv_path.read_text()
+    assert file_content == 'b,a\n2,1\n'
+
+
+def test_write_rows_after_invalid_row(tmp_path: Path) -> None:
+    csv_path = tmp_path / 'test.csv'
+
+    with scsv.CSVWriter(path=csv_path) as csv_writer:
+        with pytest.raises(ValueError):
+            csv_writer.write_rows(rows=[{'a': 1}, {'a': 2, 'b': 3}])
+        csv_writer.write_rows(rows=[{'a': 4}])
+
+    file_content = csv_path.read_text()
+    assert file_content == 'a\n4\n'
+
+
+@pytest.mark.parametrize('use_line_buffering', (False, True))
+def test_utf8_content(tmp_path: Path, use_line_buffering: bool) -> None:
+    csv_path = tmp_path / 'test.csv'
+
+    with scsv.CSVWriter(path=csv_path,
+                        use_line_buffering=use_line_buffering) as csv_writer:
+        csv_writer.write_row(ilaï='é', b='日本')
+        csv_writer.write_rows(rows=[{'ilaï': '→', 'b': 'a,b'}])
+
+    file_content = csv_path.read_text(encoding='utf-8')
+    assert file_content == 'ilaï,b\né,日本\n→,"a,b"\n'
+
+
+def test_existing_header_read_by_chunks(monkeypatch, tmp_path: Path) -> None:
+    csv_path = tmp_path / 'test.csv'
+    csv_path.write_text('abc,def\n1,2\n')
+    monkeypatch.setattr(scsv, 'HEADER_READ_SIZE', 2)
+
+    with scsv.CSVWriter(path=csv_path) as csv_writer:
+        csv_writer.write_row(**{'def': 4, 'abc': 3})
+
+    file_content = csv_path.read_text()
+    assert file_content == 'abc,def\n1,2\n3,4\n'
@@ -9,11 +9,14 @@
 # prior written permission is obtained from Lecida Inc.
 """Test for Sriracha IO utils."""
 
+import shutil
 import subprocess
 from pathlib import Path
-from typing import Dict, Set
+from typing import Dict, Sequence, Set
 
+import pandas as pd
 import pytest
+from typing_extensions import Literal
 
 import sriracha.io as sio
 
@@ -73,12 +76,14 @@ def test_gzip_file_dst_not_a_file(populated_src_dir: Path,
             sio.gzip_file(filepath=subdir)
 
 
+@pytest.mark.parametrize('compresslevel', (1, 9))
 def test_gzip_file_valid(populated_src_dir: Path,
-                         example_src_files: Dict[Path, str]) -> None:
+                         example_src_files: Dict[Path, str],
+                         compresslevel: int) -> None:
     """Try gzipping valid files."""
     for src_path, content in example_src_files.items():
         dst_path = src_path.with_suffix(f'{src_path.suffix}.gz')
-        sio.gzip_file(filepath=src_path)
+        sio.gzip_file(filepath=src_path, compresslevel=compresslevel)
         assert dst_path.exists()
 
         # noqa: S603
@@ -110,13 +115,43 @@ def test_gzip_dir_dst_not_a_dir(populated_src_dir: Path,
             sio.gzip_directory(dirpath=src_path)
 
 
+def test_gzip_dir_no_tar(populated_src_dir: Path, monkeypatch) -> None:
+    """Gzip a directory with tarfile when pigz is available, but not tar."""
+    pigz = shutil.which('gzip')
+    monkeypatch.setattr(sio.shutil, 'which',
+                        lambda name: pigz if name == 'pigz' else None)
+    sio.gzip_directory(dirpath=populated_src_dir)
+    subprocess.run(args=('tar', 'tf',
+                         str(populated_src_dir.with_suffix('.tar.gz'))),
+                   check=True, stdout=subprocess.DEVNULL)
+
+
+def test_gzip_dir_pipe_error(populated_src_dir: Path, monkeypatch) -> None:
+    """Remove the partial archive when the pipe cannot be started."""
+    monkeypatch.setattr(sio.shutil, 'which', lambda name: f'/bin/{name}')
+
+    def popen(*args, **kwargs):
+        raise FileNotFoundError
+
+    monkeypatch.setattr(sio.subprocess, 'Popen', popen)
+    with pytest.raises(FileNotFoundError):
+        sio.gzip_directory(dirpath=populated_src_dir)
+    assert not populated_src_dir.with_suffix('.tar.gz').exists()
+
+
+@pytest.mark.parametrize('use_pigz', (False, True))
 def test_gzip_dir_valid(tmp_path: Path,
                         example_src_subdirs: Set[Path],
                         example_src_files: Dict[Path, str],
-                        populated_src_dir: Path) -> None:
+                        populated_src_dir: Path,
+                        monkeypatch,
+                        use_pigz: bool) -> None:
     """Try gzipping valid directories."""
     dst_path = populated_src_dir.with_suffix('.tar.gz')
 
+    # gzip accepts the same arguments as pigz
+    pigz = shutil.which('gzip') if use_pigz else None
+    monkeypatch.setattr(sio.shutil, 'which', lambda name: pigz)
     sio.gzip_directory(dirpath=populated_src_dir)
     assert dst_path.exists()
 
@@ -136,3 +171,142 @@ def test_gzip_dir_valid(tmp_path: Path,
         p = subprocess.run(args=('tar', 'xfO', str(dst_path), str(rel_path)),
                            check=True, stdout=subprocess.PIPE)
         assert p.stdout.decode('utf-8') == content
+
+
+@pytest.mark.parametrize(('content', 'expected'),
+                         (('', 0), ('a', 0), ('a\n', 1), ('a\n\nb', 2)))
+def test_linecount(tmp_path: Path, content: str, expected: int) -> None:
+    """Count lines like wc -l does."""
+    file_path = tmp_path / 'lines.txt'
+    file_path.write_text(content)
+    assert sio.linecount(str(file_path)) == expected
+
+
+@pytest.mark.parametrize(('start_index', 'end_index'),
+                         ((0, 3), (2, 5), (4, 10)))
+@pytest.mark.parametrize('engine', ('c', 'pyarrow'))
+def test_read_csv_part(tmp_path: Path, start_index: int, end_index: int,
+                       engine: Literal['c', 'pyarrow']) -> None:
+    """Read a range of rows of a CSV file."""
+    if engine == 'pyarrow':
+        pytest.importorskip('pyarrow')
+
+    csv_path = tmp_path / 'part.csv'
+    df = pd.DataFrame({'a': range(6), 'b': list('abcdef')})
+    df.to_csv(csv_path, index=False)
+
+    df_part, start, end = sio.read_csv_part(str(csv_path), start_index,
+                                            end_index, engine=engine)
+    pd.testing.assert_frame_equal(
+        df_part, df.iloc[start_index:end_index].reset_index(drop=True)
+    )
+    assert (start, end) == (start_index, end_index)
+
+
+def test_read_csv_part_pyarrow_types(monkeypatch, tmp_path: Path) -> None:
+    """Infer the column types from all the blocks read with pyarrow."""
+    pytest.importorskip('pyarrow')
+    monkeypatch.setattr(sio, 'PYARROW_BLOCK_SIZE', 1024)
+
+    csv_path = tmp_path / 'part.csv'
+    df = pd.DataFrame({'a': [str(i) for i in range(1000)] + ['abc']})
+    df.to_csv(csv_path, index=False)
+
+    df_part, _, _ = sio.read_csv_part(str(csv_path), 2, 1001,
+                                      engine='pyarrow')
+    pd.testing.assert_frame_equal(df_part,
+                                  df.iloc[2:].reset_index(drop=True))
+
+
+def test_read_csv_part_header(tmp_path: Path) -> None:
+    """Name the columns of a CSV part like pandas does."""
+    csv_path = tmp_path / 'part.csv'
+    csv_path.write_text('a,a,b\n0,1,2\n3,4,5\n6,7,8\n')
+    df_part, _, _ = sio.read_csv_part(str(csv_path), 1, 3)
+    assert list(df_part.columns) == ['a', 'a.1', 'b']
+
+    df = pd.DataFrame({'a': range(6)}, index=range(10, 16))
+    df.to_csv(csv_path)
+    df_part, _, _ = sio.read_csv_part(str(csv_path), 1, 3)
+    pd.testing.assert_frame_equal(
+        df_part, pd.read_csv(csv_path).iloc[1:3].reset_index(drop=True)
+    )
+    assert list(df_part.columns) == ['Unnamed: 0', 'a']
+
+
+def test_read_csv_part_timestamps(tmp_path: Path) -> None:
+    """Read the rows of a CSV file within a time range."""
+    csv_path = tmp_path / 'part.csv'
+    df = pd.DataFrame({'a': range(6)})
+    df.to_csv(csv_path, index=False)
+    timestamps = list(pd.date_range('2019-01-01', periods=6, freq='H'))
+
+    df_part, start, end = sio.read_csv_part(
+        str(csv_path), pd.Timestamp('2019-01-01 01:00'),
+        pd.Timestamp('2019-01-01 03:00'), timestamps=timestamps
+    )
+    pd.testing.assert_frame_equal(df_part,
+                                  df.iloc[1:4].reset_index(drop=True))
+    assert (start, end) == (1, 4)
+
+
+def test_append_to_csv_file(tmp_path: Path) -> None:
+    """Append dataframes to a CSV file, reordering columns if needed."""
+    csv_path = str(tmp_path / 'append.csv')
+
+    sio.append_to_csv_file(csv_path, pd.DataFrame({'a': [1], 'b': [2]}))
+    sio.append_to_csv_file(csv_path, pd.DataFrame({'b': [4], 'a': [3]}))
+    assert Path(csv_path).read_text() == 'a,b\n1,2\n3,4\n'
+
+    with pytest.raises(ValueError):
+        sio.append_to_csv_file(csv_path, pd.DataFrame({'a': [5], 'c': [6]}))
+
+
+@pytest.mark.parametrize('copied', ((0,), (1, 0)))
+def test_copy_file_shortfall(monkeypatch, tmp_path: Path,
+                             copied: Sequence[int]) -> None:
+    """Copy files with shutil when copy_file_range copies too few bytes."""
+    src = tmp_path / 'src'
+    dst = tmp_path / 'dst'
+    src.write_bytes(b'abc')
+    results = iter(copied)
+    monkeypatch.setattr(sio.os, 'copy_file_range',
+                        lambda *args: next(results), raising=False)
+    sio._copy_file(str(src), str(dst))
+    assert dst.read_bytes() == b'abc'
+
+
+def test_merge_datasets(tmp_path: Path) -> None:
+    """Merge two datasets with exclusive and shared files and directories."""
+    dataset_1 = tmp_path / 'dataset_1'
+    dataset_2 = tmp_path / 'dataset_2'
+    out_dir = tmp_path / 'merged'
+    for dataset in (dataset_1, dataset_2):
+        (dataset / 'shared_dir').mkdir(parents=True)
+        (dataset / 'same.txt').write_text('same')
+        (dataset / 'shared_dir/same.txt').write_text('same')
+    (dataset_1 / 'only_1.txt').write_text('1')
+    (dataset_2 / 'only_2.txt').write_text('2')
+    (dataset_1 / 'different.txt').write_text('content 1')
+    (dataset_2 / 'different.txt').write_text('content 2')
+    (dataset_1 / 'summary.csv').write_text('a,b\n1,2\n')
+    (dataset_2 / 'summary.csv').write_text('a,b\n3,4\n')
+    (dataset_1 / 'dir_1').mkdir()
+
+    sio.merge_datasets(str(dataset_1), str(dataset_2), str(out_dir))
+
+    assert {p.name for p in out_dir.iterdir()} == {
+        'shared_dir', 'same.txt', 'only_1.txt', 'only_2.txt',
+        'different_1.txt', 'different_2.txt', 'summary.csv', 'dir_1'
+    }
+    assert (out_dir / 'same.txt').read_text() == 'same'
+    assert (out_dir / 'only_2.txt').read_text() == '2'
+    assert (out_dir / 'different_1.txt').read_text() == 'content 1'
+    assert (out_dir / 'different_2.txt').read_text() == 'content 2'
+    assert (out_dir / 'summary.csv').read_text() == 'a,b\n1,2\n3,4\n'
+    assert (out_dir / 'dir_1').is_symlink()
+    assert not (out_dir / 'same.txt').is_symlink()
+
+    # Shared directories are merged with symlinks
+    assert (out_dir / 'shared_dir/same.txt').is_symlink()
+    assert (out_dir / 'shared_dir/same.txt').read_text() == 'same'
@@ -69,3 +69,37 @@ def test_file_handler(mocked_config: Config, now: datetime.datetime,
             == now.isoformat(timespec=timespec).replace(':', ''))
 
     assert log_file.read_text() == f'{test_warning}\n{test_error}\n'
+
+
+def test_setup_logging_once(monkeypatch, mocked_config: Config) -> None:
+    """Test that setup_logging only adds its handlers once."""
+    root_logger = logging.getLogger()
+    monkeypatch.setattr(root_logger, 'handlers', [])
+    monkeypatch.setattr(root_logger, 'level', root_logger.level)
+    monkeypatch.setattr(slogging, '_logging_configured', False)
+
+    slogging.setup_logging(project='sriracha/test', verbose=False)
+    slogging.setup_logging(project='sriracha/test', verbose=False)
+
+    assert len(root_logger.handlers) == 2
+    assert all(isinstance(handler.formatter, logging.Formatter)
+               for handler in root_logger.handlers)
+    for handler in root_logger.handlers:
+        handler.close()
+
+
+def test_setup_logging_configured(monkeypatch, mocked_config: Config) -> None:
+    """Test that setup_logging keeps existing root handlers alone."""
+    root_logger = logging.getLogger()
+    handler = logging.NullHandler()
+    monkeypatch.setattr(root_logger, 'handlers', [handler])
+    monkeypatch.setattr(root_logger, 'level', root_logger.level)
+    monkeypatch.setattr(slogging, '_logging_configured', False)
+
+    slogging.setup_logging(project='sriracha/test', level=logging.DEBUG,
+                           verbose=False)
+
+    assert root_logger.handlers == [handler]
+    assert root_logger.level != logging.DEBUG
+    assert mocked_config.log_dir is not None
+    assert not (mocked_config.log_dir / 'sriracha/test').exists()
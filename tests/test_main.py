@@ -0,0 +1,130 @@
+# Copyright (C) 2019 Lecida Inc
+# All Rights Reserved.
+#
+# NOTICE:  All information contained herein is, and remains the property of
+# Lecida Inc. The intellectual and technical concepts contained herein are
+# proprietary to Lecida Inc and may be covered by U.S. and Foreign Patents,
+# patents in process, and are protected by trade secret or copyright law.
+# Dissemination or reproduction of this material is strictly forbidden unless
+# prior written permission is obtained from Lecida Inc.
+"""Test for Sriracha CLI functions."""
+
+import os
+import stat
+from configparser import ConfigParser
+from pathlib import Path
+from typing import Optional
+
+import click
+import pytest
+from click.testing import CliRunner
+
+import sriracha.main
+from sriracha.main import get_config  # Not mocked by the conftest fixture
+
+
+@pytest.fixture
+def config_path(monkeypatch, tmp_path: Path) -> Path:
+    """Return the path to a temporary config file."""
+    path = tmp_path / 'config.ini'
+    monkeypatch.setattr(sriracha.main, 'LECIDA_CONFIG_PATH', path)
+    return path
+
+
+def test_get_config(config_path: Path) -> None:
+    """Read a config file, and read it again once modified."""
+    config_path.write_text('[sriracha]\nlocal_sync_dir = /tmp/s3\n')
+    config = get_config()
+    assert config == sriracha.main.Config(local_sync_dir=Path('/tmp/s3'))
+    assert get_config() is config
+
+    config_path.write_text('[sriracha]\nlocal_sync_dir = /tmp/s3\n'
+                           'circleci_api_token = abc\n')
+    stat = config_path.stat()
+    os.utime(config_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert get_config() == sriracha.main.Config(
+        local_sync_dir=Path('/tmp/s3'), circleci_api_token='abc'
+    )
+
+
+def test_get_config_missing(config_path: Path) -> None:
+    """Try reading a config file that does not exist."""
+    with pytest.raises(ValueError):
+        get_config()
+
+
+@pytest.mark.parametrize('existing_mode', (None, 0o644, 0o600))
+def test_configure(config_path: Path, tmp_path: Path,
+                   existing_mode: Optional[int]) -> None:
+    """Write a config file, with the correct file permissions."""
+    if existing_mode is not None:
+        config_path.touch(mode=existing_mode)
+        config_path.chmod(existing_mode)
+
+    result = CliRunner().invoke(sriracha.main.cli, [
+        'configure', '-s', str(tmp_path / 's3'), '-l', str(tmp_path / 'logs'),
+        '-c', 'abc'
+    ])
+    assert result.exit_code == 0, result.output
+
+    assert stat.S_IMODE(config_path.stat().st_mode) == 0o600
+    assert get_config() == sriracha.main.Config(
+        local_sync_dir=tmp_path / 's3', log_dir=tmp_path / 'logs',
+        circleci_api_token='abc'
+    )
+
+
+def test_read_sriracha_section(tmp_path: Path) -> None:
+    """Read the sriracha section like ConfigParser does."""
+    path = tmp_path / 'config.ini'
+    path.write_text('# Comment\n'
+                    '[other]\n'
+                    'log_dir = /other\n'
+                    '\n'
+                    '[sriracha]\n'
+                    'Local_Sync_Dir = /tmp/s3\n'
+                    '; Comment\n'
+                    'log_dir: /tmp/logs\n'
+                    'circleci_api_token = a=b\n'
+                    '    c\n')
+    lecida_config = ConfigParser()
+    lecida_config.read(path)
+
+    section = sriracha.main._read_sriracha_section(path)
+    assert section == dict(lecida_config['sriracha'])
+    assert section == {'local_sync_dir': '/tmp/s3', 'log_dir': '/tmp/logs',
+                       'circleci_api_token': 'a=b\nc'}
+
+    path.write_text('[other]\nlog_dir = /other\n')
+    assert sriracha.main._read_sriracha_section(path) is None
+
+
+def test_default_dir_value(monkeypatch, tmp_path: Path) -> None:
+    """Test that default directories are created, at most once per TTL."""
+    log_dir = tmp_path / 'logs'
+    now = 1000.
+    monkeypatch.setattr(sriracha.main.time, 'monotonic', lambda: now)
+    monkeypatch.setattr(sriracha.main, '_default_dir_creation_times', {})
+
+    obj = sriracha.main._ClickContext(sriracha_config={'log_dir':
+                                                       str(log_dir)})
+    with click.Context(sriracha.main.cli, obj=obj):
+        fn = sriracha.main._get_default_value_from_ctx(key='log_dir',
+                                                       is_dir=True)
+        assert fn() == str(log_dir)
+        assert log_dir.is_dir()
+
+        log_dir.rmdir()
+        now += sriracha.main.DEFAULT_DIR_CACHE_TTL / 2
+        assert fn() == str(log_dir)
+        assert not log_dir.exists()
+
+        now += sriracha.main.DEFAULT_DIR_CACHE_TTL
+        assert fn() == str(log_dir)
+        assert log_dir.is_dir()
+
+
+def test_config_coercers() -> None:
+    """Test that every Config field can be read from the config file."""
+    assert (set(sriracha.main._CONFIG_COERCERS)
+            == set(sriracha.main.Config._fields))
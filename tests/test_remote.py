@@ -9,9 +9,16 @@
 # prior written permission is obtained from Lecida Inc.
 """Test for Sriracha remote utils."""
 
-from hashlib import sha1
+import datetime
+import hashlib
+import io
+import mmap
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatchcase
 from pathlib import Path
-from typing import Callable, Dict, Optional, Sequence, Set
+from typing import Callable, Iterator, Optional, Sequence, Union
 
 import pytest
 
@@ -25,7 +32,7 @@ TEST_BUCKET = 'lecida-test-bucket'
 TEST_DIR = 'circleci/sriracha/remote/v2'
 TEST_PATH = f's3://{TEST_BUCKET}/{TEST_DIR}'
 
-FILE_HASHES = {
+FILE_HEX_HASHES = {
     '1.abc.def': 'a4f3c4f6fb6ac5ffffe009c9d26a33c875d240f3',
     'empty_file': 'da39a3ee5e6b4b0d3255bfef95601890afd80709',
     '.updsasd': '182370b4007fc1b39424f53112be962bf0d9d5a6',
@@ -33,7 +40,17 @@ FILE_HASHES = {
     'folder/987': 'da39a3ee5e6b4b0d3255bfef95601890afd80709',
     'folder.manifest': 'a852db4db68bb42ec01d35714ccfd4c299948d0e'
 }
+# Raw SHA-1 digests, compared to the ones of the downloaded files
+FILE_HASHES = {file_name: bytes.fromhex(file_hash)
+               for file_name, file_hash in FILE_HEX_HASHES.items()}
 DIR_NAMES = ('folder',)
+DOWNLOAD_FILE_PARAMS = tuple(
+    pytest.param(f'full/{file_name}', file_hash, id=file_name)
+    for file_name, file_hash in FILE_HASHES.items()
+)
+
+# Number of threads hashing downloaded files
+HASH_MAX_WORKERS = 8
 
 
 InvPReason = remote.InvalidS3Path.Reason
@@ -49,6 +66,10 @@ def get_download_path(mocked_config: Config) -> GetDownloadPath:
         mocked_config: The mocked configuration.
 
     """
+    assert mocked_config.local_sync_dir is not None
+    sync_dir = os.path.join(mocked_config.local_sync_dir, TEST_BUCKET,
+                            TEST_DIR)
+
     def fn(rel_path: str, include_patterns: IncludePatterns = None)\
             -> Path:
         """Download a file/directory and return its path.
@@ -61,13 +82,12 @@ def get_download_path(mocked_config: Config) -> GetDownloadPath:
             The path of the sync object.
 
         """
-        dst_path = Path(remote.s3_to_local(s3_path=f'{TEST_PATH}/{rel_path}',
-                                           include_patterns=include_patterns))
+        dst_path = remote.s3_to_local(s3_path=f'{TEST_PATH}/{rel_path}',
+                                      include_patterns=include_patterns)
 
-        assert mocked_config.local_sync_dir is not None
-        assert dst_path == (mocked_config.local_sync_dir / TEST_BUCKET
-                            / TEST_DIR / rel_path)
-        return dst_path
+        # s3_to_local returns the joined path as is
+        assert dst_path == os.path.join(sync_dir, rel_path)
+        return Path(dst_path)
 
     return fn
 
@@ -98,18 +118,36 @@ def test_invalid_path(path: str, reason: InvPReason) -> None:
     assert e.value.reason == reason
 
 
-def _get_file_hash(path: Path) -> str:
-    return sha1(path.read_bytes()).hexdigest()  # noqa: S303
+def _scan_tree(path: str) -> Iterator[os.DirEntry]:
+    """Yield the entries of a directory tree, recursively.
+
+    Contrary to Path.glob, no Path object is created, and the file types are
+    read from the directory entries.
+    """
+    with os.scandir(path) as entries:
+        for entry in entries:
+            yield entry
+            if entry.is_dir(follow_symlinks=False):
+                yield from _scan_tree(entry.path)
+
+
+def _get_file_hash(path: Union[str, Path]) -> bytes:
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # Empty files cannot be mapped
+            return hashlib.sha1().digest()  # noqa: S303
+
+        # The mapped pages are hashed in place, without copying the file
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return hashlib.sha1(mapped).digest()  # noqa: S303
 
 
 # TODO: Test download_mode
-@pytest.mark.parametrize(('rel_path', 'file_hash'),
-                         ((f'full/{file_name}', file_hash)
-                          for file_name, file_hash in FILE_HASHES.items()))
+@pytest.mark.parametrize(('rel_path', 'file_hash'), DOWNLOAD_FILE_PARAMS)
 @pytest.mark.parametrize('include_patterns',
                          (None, (), ('*.def', 'empty_file')))
 def test_download_file(get_download_path: GetDownloadPath, rel_path: str,
-                       include_patterns: IncludePatterns, file_hash: str)\
+                       include_patterns: IncludePatterns, file_hash: bytes)\
         -> None:
     """Test downloading a file.
 
@@ -134,33 +172,293 @@ def test_download_file(get_download_path: GetDownloadPath, rel_path: str,
 
 # TODO: Test download_mode, include_patterns
 @pytest.mark.parametrize('rel_path', ('full',))
-@pytest.mark.parametrize('file_hashes', (FILE_HASHES,))
-@pytest.mark.parametrize('dir_names', (DIR_NAMES,))
-@pytest.mark.parametrize('include_patterns', (None,))
-def test_download_dir(get_download_path: GetDownloadPath, rel_path: str,
-                      include_patterns: IncludePatterns,
-                      file_hashes: Dict[str, str],
-                      dir_names: Set[str]) -> None:
+def test_download_dir(get_download_path: GetDownloadPath,
+                      rel_path: str) -> None:
     """Test syncing a directory.
 
+    The files and subdirectories of the directory are expected to be
+    FILE_HASHES and DIR_NAMES.
+
     Args:
         get_download_path: The path download fixture.
-        include_patterns: Argument passed to s3_to_local.
-        file_hashes: The expected {file name → file relative path} dictionary
-            for the requested directory.
-        dir_names: The expected set of subdirectory names for the requested
-            directory.
+        rel_path: The relative path of the directory.
 
     """
-    downloaded_path = get_download_path(rel_path, include_patterns)
+    file_hashes = FILE_HASHES
+    dir_names = DIR_NAMES
+    downloaded_path = get_download_path(rel_path, None)
     assert downloaded_path.is_dir()
 
-    files_and_dirs = list(downloaded_path.glob('**/*'))
-    assert len(files_and_dirs) == len(file_hashes) + len(dir_names)
-    for path in files_and_dirs:
-        file_rel_path = str(path.relative_to(downloaded_path))
-        if path.is_file():
-            file_hash = file_hashes[file_rel_path]
-            assert _get_file_hash(path) == file_hash
+    entries = list(_scan_tree(str(downloaded_path)))
+    assert len(entries) == len(file_hashes) + len(dir_names)
+    files = []
+    for entry in entries:
+        file_rel_path = os.path.relpath(entry.path, downloaded_path)
+        if entry.is_file():
+            files.append((file_rel_path, entry.path))
         else:
             assert file_rel_path in dir_names
+
+    # Reads and hashes release the GIL
+    with ThreadPoolExecutor(max_workers=HASH_MAX_WORKERS) as executor:
+        hashes = executor.map(_get_file_hash, (path for _, path in files))
+        for (file_rel_path, _), file_hash in zip(files, hashes):
+            assert file_hash == file_hashes[file_rel_path]
+
+
+@pytest.mark.parametrize(
+    ('download_mode', 'size', 'mtime', 'expected'),
+    ((remote.DownloadMode.ALWAYS_DOWNLOAD, 3, 1e9, False),
+     (remote.DownloadMode.FILE_DOES_NOT_EXIST, 4, 0, True),
+     (remote.DownloadMode.SIZE_ONLY, 3, 0, True),
+     (remote.DownloadMode.SIZE_ONLY, 4, 1e9, False),
+     (remote.DownloadMode.SIZE_AND_TIMESTAMP, 3, 1e9, True),
+     (remote.DownloadMode.SIZE_AND_TIMESTAMP, 3, 0, False),
+     (remote.DownloadMode.NEVER_DOWNLOAD, 4, 0, True))
+)
+def test_is_up_to_date(tmp_path: Path, download_mode: remote.DownloadMode,
+                       size: int, mtime: float, expected: bool) -> None:
+    """Test the download decision for an existing local file.
+
+    Args:
+        tmp_path: The temporary directory.
+        download_mode: The download mode.
+        size: The size of the S3 object.
+        mtime: The modification timestamp of the S3 object.
+        expected: Whether the local file is expected to be up to date.
+
+    """
+    local_path = tmp_path / 'file'
+    local_path.write_bytes(b'abc')
+    os.utime(local_path, (1e9, 1e9))
+    last_modified = datetime.datetime.fromtimestamp(mtime,
+                                                    tz=datetime.timezone.utc)
+
+    assert remote._is_up_to_date(local_stat=local_path.stat(), size=size,
+                                 last_modified=last_modified,
+                                 download_mode=download_mode) == expected
+
+
+def test_is_up_to_date_missing_file(tmp_path: Path) -> None:
+    """Test the download decision for a missing local file."""
+    last_modified = datetime.datetime.now(tz=datetime.timezone.utc)
+    assert not remote._is_up_to_date(
+        local_stat=remote._stat_if_exists(tmp_path / 'missing'), size=0,
+        last_modified=last_modified,
+        download_mode=remote.DownloadMode.FILE_DOES_NOT_EXIST
+    )
+
+
+def test_get_s3_client() -> None:
+    """Test that the S3 client is shared by all threads."""
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        clients = set(executor.map(lambda _: remote.get_s3_client(),
+                                   range(8)))
+    assert clients == {remote.get_s3_client()}
+
+
+def test_get_transfer_manager() -> None:
+    """Test that the transfer manager is shared by all threads."""
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        managers = set(executor.map(lambda _: remote._get_transfer_manager(),
+                                    range(8)))
+    assert managers == {remote._get_transfer_manager()}
+    assert (remote.get_s3_client().meta.config.max_pool_connections
+            == remote.MAX_CONCURRENCY)
+
+
+def test_provide_size_subscriber() -> None:
+    """Test that the size of the downloads is given to s3transfer."""
+    from s3transfer.futures import TransferFuture, TransferMeta
+
+    meta = TransferMeta()
+    remote._ProvideSizeSubscriber(123, '"abc"').on_queued(
+        future=TransferFuture(meta=meta)
+    )
+    assert meta.size == 123
+    if hasattr(meta, 'etag'):
+        assert meta.etag == '"abc"'
+
+
+@pytest.mark.parametrize('patterns', ((), ('*.def',), ('*.def', 'empty_file'),
+                                      ('folder/*', '.u*')))
+def test_compile_patterns(patterns: Sequence[str]) -> None:
+    """Test that compiled patterns match like fnmatchcase."""
+    matcher = remote._compile_patterns(tuple(patterns))
+    for rel_path in FILE_HASHES:
+        assert (matcher.match(rel_path) is not None) == any(
+            fnmatchcase(rel_path, pattern) for pattern in patterns
+        )
+
+
+def test_s3_to_local_many() -> None:
+    """Test that local paths are returned unchanged and in order."""
+    paths = [f'/tmp/{i}' for i in range(10)]
+    assert remote.s3_to_local_many(paths, max_workers=4) == paths
+
+
+def test_not_found_cache(monkeypatch) -> None:
+    """Test that paths with no object are not requested again right away."""
+    calls = []
+
+    def classify(bucket: str, key: str):
+        calls.append((bucket, key))
+        return 'missing', {}
+
+    now = 1000.
+    monkeypatch.setattr(remote, '_classify', classify)
+    monkeypatch.setattr(remote.time, 'monotonic', lambda: now)
+    monkeypatch.setattr(remote, '_not_found_expiries', OrderedDict())
+
+    expected_call = (TEST_BUCKET, f'{TEST_DIR}/missing')
+    for expected_calls in ([expected_call], [], [expected_call]):
+        with pytest.raises(remote.InvalidS3Path) as e:
+            remote.s3_to_local(f'{TEST_PATH}/missing')
+        assert e.value.reason == InvPReason.NO_OBJECT_FOUND
+        assert calls == expected_calls
+        calls.clear()
+        now += remote.NOT_FOUND_TTL / 2 + 1
+
+
+def test_not_found_cache_eviction(monkeypatch) -> None:
+    """Test that expired and oldest not found paths are evicted."""
+    now = 1000.
+    monkeypatch.setattr(remote.time, 'monotonic', lambda: now)
+    monkeypatch.setattr(remote, '_not_found_expiries', OrderedDict())
+    monkeypatch.setattr(remote, 'NOT_FOUND_MAX_SIZE', 2)
+
+    for key in ('a', 'b', 'c'):
+        remote._add_not_found(TEST_BUCKET, key)
+    assert list(remote._not_found_expiries) == [(TEST_BUCKET, 'b'),
+                                                (TEST_BUCKET, 'c')]
+    assert not remote._is_not_found(TEST_BUCKET, 'a')
+    assert remote._is_not_found(TEST_BUCKET, 'b')
+
+    now += remote.NOT_FOUND_TTL
+    remote._add_not_found(TEST_BUCKET, 'd')
+    assert list(remote._not_found_expiries) == [(TEST_BUCKET, 'd')]
+
+
+def test_not_found_cache_cleared(monkeypatch, mocked_config: Config) -> None:
+    """Test that downloads forget the paths not found under them."""
+    kinds = {f'{TEST_DIR}/missing': 'missing', TEST_DIR: 'dir'}
+    monkeypatch.setattr(remote, '_classify',
+                        lambda bucket, key: (kinds[key], {}))
+    monkeypatch.setattr(remote, '_download_s3_dir', lambda *args: None)
+    monkeypatch.setattr(remote, '_not_found_expiries', OrderedDict())
+
+    remote._add_not_found('other-bucket', f'{TEST_DIR}/missing')
+    with pytest.raises(remote.InvalidS3Path):
+        remote.s3_to_local(f'{TEST_PATH}/missing')
+    assert remote._is_not_found(TEST_BUCKET, f'{TEST_DIR}/missing')
+
+    remote.s3_to_local(TEST_PATH)
+    assert list(remote._not_found_expiries) == [
+        ('other-bucket', f'{TEST_DIR}/missing')
+    ]
+
+
+@pytest.mark.parametrize(
+    ('keys', 'key', 'expected'),
+    (([], 'abc', 'missing'),
+     (['abc', 'abc/def'], 'abc', 'file'),
+     (['abc/def'], 'abc', 'dir'),
+     (['abc-def', 'abc/'], 'abc', 'dir'),
+     (['abc-def', 'abc/def'], 'abc', 'dir'),
+     (['abc-def'], 'abc', 'missing'),
+     (['abc/'], 'abc', 'dir'),
+     (['abc'], '', 'dir'))
+)
+def test_classify(monkeypatch, keys: Sequence[str], key: str,
+                  expected: str) -> None:
+    """Test finding out whether an S3 path is a file or a directory.
+
+    Args:
+        monkeypatch: The pytest monkeypatch fixture.
+        keys: The keys in the bucket.
+        key: The key to classify.
+        expected: The expected kind of S3 path.
+
+    """
+    from botocore.exceptions import ClientError
+
+    class Client:
+        def list_objects_v2(self, Bucket: str, Prefix: str,  # noqa: N803
+                            MaxKeys: int):
+            contents = [{'Key': k} for k in sorted(keys)
+                        if k.startswith(Prefix)][:MaxKeys]
+            return {'Contents': contents} if contents else {}
+
+        def head_object(self, Bucket: str, Key: str):  # noqa: N803
+            if Key not in keys:
+                raise ClientError({'Error': {'Code': '404'}}, 'HeadObject')
+            return {'ContentLength': 0}
+
+    monkeypatch.setattr(remote, '_s3_client', Client())
+    kind, obj = remote._classify(TEST_BUCKET, key)
+    assert kind == expected
+    if expected == 'missing':
+        assert obj == {}
+    else:
+        assert obj['Key'] in keys
+
+
+@pytest.mark.parametrize('umask', (0o022, 0o077))
+def test_download_small_file_mode(monkeypatch, tmp_path: Path,
+                                  umask: int) -> None:
+    """Test that small downloads get their file mode from the umask.
+
+    Args:
+        monkeypatch: The pytest monkeypatch fixture.
+        tmp_path: The temporary directory.
+        umask: The umask during the download.
+
+    """
+    data = b'abc'
+    last_modified = datetime.datetime(2019, 1, 2, 3, 4, 5,
+                                      tzinfo=datetime.timezone.utc)
+
+    class Client:
+        def get_object(self, Bucket: str, Key: str):  # noqa: N803
+            return {'Body': io.BytesIO(data), 'LastModified': last_modified}
+
+    monkeypatch.setattr(remote, '_s3_client', Client())
+    local_path = os.path.join(tmp_path, 'abc')
+    old_umask = os.umask(umask)
+    try:
+        remote._download_s3_file(local_path=local_path, bucket=TEST_BUCKET,
+                                 key='abc', size=len(data),
+                                 last_modified=last_modified, etag='"abc"')
+    finally:
+        os.umask(old_umask)
+
+    assert os.listdir(tmp_path) == ['abc']
+    local_stat = os.stat(local_path)
+    assert local_stat.st_mode & 0o777 == 0o666 & ~umask
+    assert local_stat.st_mtime == last_modified.timestamp()
+    assert _get_file_hash(local_path) == hashlib.sha1(data).digest()
+
+
+def test_download_deleted_file(monkeypatch, tmp_path: Path) -> None:
+    """Test downloading a file that was deleted since it was listed.
+
+    Args:
+        monkeypatch: The pytest monkeypatch fixture.
+        tmp_path: The temporary directory.
+
+    """
+    from botocore.exceptions import ClientError
+
+    class Client:
+        def get_object(self, Bucket: str, Key: str):  # noqa: N803
+            raise ClientError({'Error': {'Code': 'NoSuchKey'}}, 'GetObject')
+
+    monkeypatch.setattr(remote, '_s3_client', Client())
+    with pytest.raises(remote.InvalidS3Path) as e:
+        remote._download_s3_file(
+            local_path=os.path.join(tmp_path, 'abc'), bucket=TEST_BUCKET,
+            key='abc', size=3, last_modified=datetime.datetime.now(),
+            etag='"abc"'
+        )
+    assert e.value.reason == InvPReason.NO_OBJECT_FOUND
+    assert os.listdir(tmp_path) == []
@@ -20,29 +20,85 @@ import sriracha.time as time_utils
 
 @pytest.fixture()
 def timestamps() -> pd.Series:
-    return pd.Series(pd.to_datetime(np.arange(17)
-                                    * datetime.timedelta(1).total_seconds()
-                                    * 1e9))
+    return pd.Series(pd.date_range(start='1970-01-01', periods=17, freq='D'))
 
 
 @pytest.fixture()
 def seq() -> pd.Series:
-    return pd.Series([0, 0, 0, 0, 1, 1, 1, 0, 0, 0, 0, 0, 1, 1, 1, 1, 1])
+    return pd.Series(np.array([0, 0, 0, 0, 1, 1, 1, 0, 0, 0, 0, 0,
+                               1, 1, 1, 1, 1], dtype=np.int8))
+
+
+@pytest.mark.parametrize(
+    'ts',
+    (pytest.param('2019-02-03T04:05:06.789', id='str'),
+     pytest.param(datetime.datetime(2019, 2, 3, 4, 5, 6, 789000),
+                  id='datetime'),
+     pytest.param(np.datetime64('2019-02-03T04:05:06.789123456'), id='numpy'),
+     pytest.param(pd.Timestamp('2019-02-03T04:05:06.789123456'), id='pandas'))
+)
+def test_time_to_string(ts: time_utils.TSType) -> None:
+    expected = pd.Timestamp(ts).to_pydatetime(warn=False)
+    assert time_utils.time_to_string(ts) == (
+        f'2019-02-03T04-05-06-{expected.microsecond:06}'
+    )
+    assert time_utils.time_to_isoformat(ts) == expected.isoformat()
+
+
+@pytest.mark.parametrize(
+    'ts',
+    (pytest.param('NaT', id='str'),
+     pytest.param(np.datetime64('NaT'), id='numpy'),
+     pytest.param(pd.NaT, id='pandas'))
+)
+def test_time_to_string_nat(ts: time_utils.TSType) -> None:
+    with pytest.raises(ValueError):
+        time_utils.time_to_string(ts)
+    assert time_utils.time_to_isoformat(ts) == 'NaT'
+
+
+@pytest.mark.parametrize(
+    ('start_day', 'end_day'),
+    ((0, 16), (5, 11), (6, 12), (7, 11), (-2, -1), (8, 3), (20, 30))
+)
+def test_is_overlapping(timestamps: pd.Series, seq: pd.Series,
+                        start_day: int, end_day: int) -> None:
+    segments = time_utils.get_segments(seq, timestamps=timestamps)
+    start = timestamps[0] + pd.Timedelta(days=start_day)
+    end = timestamps[0] + pd.Timedelta(days=end_day)
+    expected = ((segments['end_timestamp'] >= start)
+                & (segments['start_timestamp'] <= end))
+    for assume_sorted in (False, True):
+        overlapping = time_utils.is_overlapping(segments, start, end,
+                                                assume_sorted=assume_sorted)
+        pd.testing.assert_series_equal(overlapping, expected,
+                                       check_names=False)
 
 
 @pytest.mark.parametrize('input_timedelta',
                          (pytest.param(datetime.timedelta(1), id='datetime'),
                           pytest.param(np.timedelta64(1, 'D'), id='numpy'),
-                          pytest.param(pd.Timedelta('1D'), id='pandas')))
+                          pytest.param(pd.Timedelta('1D'), id='pandas'),
+                          pytest.param('1D', id='str')))
 def test_timedelta_to_days(input_timedelta: time_utils.TDType) -> None:
     # test datetime.timedelta
     delta_days = time_utils.timedelta_to_days(input_timedelta)
     assert delta_days == 1.0
 
 
+@pytest.mark.parametrize('input_timedelta',
+                         (np.timedelta64(1), np.timedelta64(36, 'h'),
+                          np.timedelta64(1500, 'ms'), np.timedelta64('NaT')))
+def test_timedelta64_to_days(input_timedelta: np.timedelta64) -> None:
+    np.testing.assert_equal(
+        time_utils.timedelta_to_days(input_timedelta),
+        pd.Timedelta(input_timedelta) / pd.Timedelta(days=1)
+    )
+
+
 def test_timedelta_arr_to_days(timestamps: pd.Series) -> None:
     # pandas series
-    td_arr = timestamps[1:] - timestamps[:-1].values
+    td_arr = pd.Series(np.diff(timestamps.values))
     delta_days_arr = time_utils.timedelta_arr_to_days(td_arr)
     assert np.all(delta_days_arr == 1.0)
 
@@ -55,6 +111,11 @@ def test_timedelta_arr_to_days(timestamps: pd.Series) -> None:
     delta_days_arr = time_utils.timedelta_arr_to_days(timestamps)
     assert np.all(delta_days_arr == 1.0)
 
+    # strings and missing values
+    delta_days_arr = time_utils.timedelta_arr_to_days(['1D', '12h', None])
+    assert delta_days_arr[:2].tolist() == [1.0, 0.5]
+    assert np.isnan(delta_days_arr[2])
+
 
 @pytest.mark.parametrize('query_start,query_end',
                          (pytest.param(datetime.datetime(1970, 1, 1),
@@ -85,7 +146,7 @@ def test_get_segments(seq: pd.Series, segment_mode: str) -> None:
     if segment_mode == 'numpy':
         sequence = seq.values
     elif segment_mode == 'list':
-        sequence = seq.values.tolist()
+        sequence = seq.tolist()
     else:
         assert segment_mode == 'pandas'
         sequence = seq
@@ -100,12 +161,55 @@ def test_get_segments(seq: pd.Series, segment_mode: str) -> None:
     )
 
 
+@pytest.mark.parametrize(
+    ('errors', 'ignore_value', 'expected_starts', 'expected_ends'),
+    (([0, 0, 1, 2, 0, 3], 0., [2, 5], [4, 6]),
+     ([1, 1, 0, 1], 0., [0, 3], [2, 4]),
+     ([], 0., [], []),
+     ([0, 0], 0., [], []),
+     ([np.nan, 1., 0., np.nan, 2.], np.nan, [1, 4], [3, 5]),
+     ([False, True, True, False], False, [1], [3]))
+)
+def test_get_segments_indices(errors: list, ignore_value: float,
+                              expected_starts: list,
+                              expected_ends: list) -> None:
+    segments = time_utils.get_segments(errors, ignore_value=ignore_value)
+    assert list(segments.columns) == ['start_index', 'end_index',
+                                      'index_length']
+    assert segments['start_index'].tolist() == expected_starts
+    assert segments['end_index'].tolist() == expected_ends
+
+
+@pytest.mark.parametrize(
+    ('coalesce_interval_days', 'expected_starts', 'expected_ends'),
+    ((1, [0, 2, 6], [1, 3, 7]),
+     (3, [0, 6], [3, 7]),
+     (5, [0], [7]))
+)
+def test_coalesce_segments(timestamps: pd.Series,
+                           coalesce_interval_days: float,
+                           expected_starts: list, expected_ends: list) -> None:
+    segments = time_utils.get_segments([1, 0, 1, 0, 0, 0, 1],
+                                       timestamps=timestamps[:7])
+    coalesced = time_utils.coalesce_segments(
+        segments, coalesce_interval_days=coalesce_interval_days
+    )
+    assert list(coalesced.columns) == list(segments.columns)
+    assert coalesced['start_index'].tolist() == expected_starts
+    assert coalesced['end_index'].tolist() == expected_ends
+    assert np.all(coalesced['start_timestamp'].values
+                  == timestamps.values[expected_starts])
+    assert np.all(coalesced['end_timestamp'].values
+                  == timestamps.values[np.asarray(expected_ends) - 1])
+    assert coalesced is not segments
+
+
 @pytest.mark.parametrize('timestamp_mode', ('pandas', 'numpy', 'list'))
 def test_days_since_epoch(timestamps: pd.Series, timestamp_mode: str):
     if timestamp_mode == 'numpy':
         ts = timestamps.values
     elif timestamp_mode == 'list':
-        ts = list(timestamps.values)
+        ts = list(timestamps)
     else:
         assert timestamp_mode == 'pandas'
         ts = timestamps
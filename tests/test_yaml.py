@@ -10,8 +10,11 @@
 """Tests for YAML utilities."""
 
 from pathlib import Path
+from typing import Dict
+from uuid import uuid5
 
 import pytest
+import yaml
 from yaml.constructor import ConstructorError
 
 import sriracha.yaml as syaml
@@ -81,10 +84,20 @@ LOAD_PARAMS = (
 )
 
 
+@pytest.fixture(scope='module')
+def yaml_files() -> Dict[str, bytes]:
+    """Return the contents of the YAML test files, by file name.
+
+    The files are read once for the whole module, instead of copying the test
+    data directory for each test like the datadir fixture.
+    """
+    return {path.name: path.read_bytes()
+            for path in Path(__file__).with_suffix('').glob('*.yml')}
+
+
 @pytest.mark.parametrize('file_name', LOAD_PARAMS)
-def test_loading(datadir: Path, file_name: str) -> None:
-    with (datadir / file_name).open() as f:
-        syaml.load(f)
+def test_loading(yaml_files: Dict[str, bytes], file_name: str) -> None:
+    syaml.load(yaml_files[file_name])
 
 
 @pytest.mark.parametrize('tag', ('!Invalid', 'MyClass'))
@@ -97,3 +110,57 @@ def test_invalid_tag(tag: str) -> None:
     with pytest.raises(Exception):
         class InvalidClass1(Base, yaml_tag=tag):
             ...
+
+
+@pytest.mark.parametrize(
+    ('filter_prefix', 'expected'),
+    (('', {'!MyTag': SimpleRegisteredClass, '!FooClass': Foo}),
+     ('!My', {'!MyTag': SimpleRegisteredClass}),
+     ('!Bar', {}))
+)
+def test_get_lecida_yaml_tag_mapping(filter_prefix: str, expected: dict) \
+        -> None:
+    mapping = syaml.get_lecida_yaml_tag_mapping(filter_prefix=filter_prefix)
+    assert {tag: cls for tag, cls in mapping.items()
+            if tag in ('!MyTag', '!FooClass')} == expected
+    assert all(tag.startswith(filter_prefix) for tag in mapping)
+
+
+def test_input_hash(yaml_files: Dict[str, bytes]) -> None:
+    data = syaml.load(yaml_files['valid.yml'])
+    foo = data['dict_with_invalid_tag']['alsoValid']
+    expected_hash = str(uuid5(namespace=syaml.LECIDA_YAML_UUID_NAMESPACE,
+                              name=repr(foo._yaml_input_node)))
+    assert foo.input_hash == expected_hash
+    assert str(foo) == f'!FooClass#{expected_hash[:8]}'
+    assert repr(foo) == (f'!FooClass#{expected_hash}'
+                         f'(arg1=2,arg2=5,kwarg1=nan)')
+
+
+def test_dump_load(yaml_files: Dict[str, bytes]) -> None:
+    data = syaml.load(yaml_files['valid.yml'])
+    dumped = syaml.dump(data)
+    reloaded = syaml.load(dumped)
+    assert syaml.dump(reloaded) == dumped
+    for key in ('valid', 'alsoValid'):
+        assert (repr(reloaded['dict_with_invalid_tag'][key])
+                == repr(data['dict_with_invalid_tag'][key]))
+
+
+def test_parameter_representation() -> None:
+    foo = syaml.load('!FooClass {arg1: 1, arg2: 2}')
+    value = {'a': [1, 2.5, 'b', None, True, foo], 'c': {'d': foo}}
+    foo_repr = f'!FooClass#{foo.input_hash}'
+    assert syaml._Constructor._parameter_representation(value) == {
+        'a': [1, 2.5, 'b', None, True, foo_repr], 'c': {'d': foo_repr}
+    }
+    assert (syaml._Constructor._parameter_representation(value, deep=False)
+            is value)
+
+
+@pytest.mark.skipif(not yaml.__with_libyaml__,
+                    reason='PyYAML is built without libyaml')
+def test_libyaml() -> None:
+    """Test that the libyaml based loader and dumper are used."""
+    assert issubclass(syaml.Loader, yaml.CSafeLoader)
+    assert issubclass(syaml.Dumper, yaml.CSafeDumper)